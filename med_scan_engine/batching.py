@@ -0,0 +1,113 @@
+import asyncio
+import os
+from typing import Any, Callable, List
+from metrics import REGISTRY
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+def env_int(name: str, default: int) -> int:
+    """Integer setting from the environment (default if unset or invalid)"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        print(f"Warning: invalid {name}={os.environ[name]!r}, using {default}")
+        return default
+
+class MicroBatcher:
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 8,
+                 max_wait_ms: float = 10.0, name: str = "batch"):
+        """
+        Collects concurrent submit() calls into batches for fn.
+        - fn takes a list of items and returns one result per item, in order;
+          an Exception in place of a result fails only that item's request
+        - A batch is dispatched when max_batch_size items are waiting or
+          max_wait_ms after its first item arrived, whichever comes first
+        - Batches run one at a time in a worker thread; requests arriving
+          meanwhile form the next batch
+        If a batch fails, its items are retried one by one so a single bad
+        input only fails its own request.
+        """
+        self.fn = fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+        self._queue = None
+        self._loop = None
+        self._worker = None
+        self.batch_sizes = REGISTRY.histogram(
+            "medscan_batch_size", "Items per micro-batch", buckets=BATCH_SIZE_BUCKETS)
+        self.queue_wait = REGISTRY.histogram(
+            "medscan_batch_queue_wait_seconds", "Time from submit until the batch starts")
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Queue and worker belong to the loop they were created on
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+        future = loop.create_future()
+        await self._queue.put((item, future, loop.time()))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            deadline = batch[0][2] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    # Deadline passed: still take whatever is already queued
+                    if queue.empty():
+                        break
+                    batch.append(queue.get_nowait())
+                    continue
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Requests cancelled while queued (client gone) are dropped
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                continue
+
+            started = loop.time()
+            for _, _, submitted in batch:
+                self.queue_wait.observe(started - submitted, batcher=self.name)
+            self.batch_sizes.observe(len(batch), batcher=self.name)
+
+            items = [item for item, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(None, self.fn, items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name}: got {len(results)} results for {len(items)} items")
+                outcomes = [(None, result) if isinstance(result, Exception) else (result, None)
+                            for result in results]
+            except Exception as e:
+                if len(items) == 1:
+                    outcomes = [(None, e)]
+                else:
+                    outcomes = await loop.run_in_executor(None, self._run_each, items)
+
+            for (_, future, _), (result, error) in zip(batch, outcomes):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def _run_each(self, items: List[Any]) -> List[tuple]:
+        """Fallback after a failed batch: (result, error) per item"""
+        outcomes = []
+        for item in items:
+            try:
+                result = self.fn([item])[0]
+            except Exception as e:
+                result = e
+            outcomes.append((None, result) if isinstance(result, Exception) else (result, None))
+        return outcomes
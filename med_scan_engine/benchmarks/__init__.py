@@ -0,0 +1,4 @@
+"""
+Offline benchmarks for the MedScan pipeline.
+Run from the med_scan_engine directory, e.g. python -m benchmarks.rules_bench
+"""
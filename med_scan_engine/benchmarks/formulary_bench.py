@@ -0,0 +1,82 @@
+import argparse
+import random
+import string
+import time
+from typing import List
+
+import numpy as np
+
+from formulary import Formulary
+
+# Drug-like morphemes, so names share trigrams the way real formularies do
+PREFIXES = ["am", "ator", "cef", "clo", "dex", "esc", "flu", "gli", "hydro", "lev", "lo", "met",
+            "mon", "nor", "ome", "pan", "par", "pra", "ros", "ser", "tel", "val", "war", "zol"]
+MIDDLES = ["a", "i", "o", "u", "ami", "ari", "eti", "ilo", "oxa", "ura", "ven", "xi", "tra", "pro"]
+SUFFIXES = ["cillin", "statin", "pril", "sartan", "olol", "azole", "prazole", "mab", "nib", "vir",
+            "dipine", "tidine", "mycin", "floxacin", "zepam", "etine", "amine", "one", "ide", "ate"]
+
+def synthetic_names(count: int, rng: random.Random) -> List[str]:
+    names = set()
+    while len(names) < count:
+        parts = [rng.choice(PREFIXES)] + [rng.choice(MIDDLES) for _ in range(rng.randint(0, 2))]
+        names.add("".join(parts + [rng.choice(SUFFIXES)]).capitalize())
+    return sorted(names)
+
+def typo(name: str, rng: random.Random) -> str:
+    """One random edit (substitution, deletion or insertion)"""
+    i = rng.randrange(len(name))
+    op = rng.choice("sdi")
+    letter = rng.choice(string.ascii_lowercase)
+    if op == "s":
+        return name[:i] + letter + name[i + 1:]
+    if op == "d":
+        return name[:i] + name[i + 1:]
+    return name[:i] + letter + name[i:]
+
+def time_lookups(formulary: Formulary, queries: List[str]) -> np.ndarray:
+    """Per-query latency in microseconds, bypassing the lookup cache"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        formulary._lookup(query)
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1e6
+
+def report(label: str, us: np.ndarray):
+    print(f"{label:24s} mean {us.mean():8.1f} us  p50 {np.percentile(us, 50):8.1f} us  "
+          f"p99 {np.percentile(us, 99):8.1f} us  max {us.max():8.1f} us")
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark: fuzzy formulary lookup on a large synthetic index")
+    parser.add_argument("--names", type=int, default=100000, help="Synthetic formulary size")
+    parser.add_argument("--queries", type=int, default=2000, help="Queries per category")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = synthetic_names(args.names, rng)
+    start = time.perf_counter()
+    formulary = Formulary({name: name for name in names})
+    print(f"Indexed {len(formulary)} names in {time.perf_counter() - start:.1f} s")
+
+    sample = rng.sample(names, min(args.queries, len(names)))
+    categories = {
+        "exact": sample,
+        "one typo": [typo(name, rng) for name in sample],
+        "short miss (4-6)": ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 6)))
+                             for _ in range(args.queries)],
+        "morpheme miss": [rng.choice(PREFIXES) + rng.choice(["x", "q", "zz"]) + rng.choice(MIDDLES)
+                          for _ in range(args.queries)],
+        "word miss": ["deMart", "shatr", "Patient", "Clinic", "Morning", "Hospital"] * (args.queries // 6),
+    }
+
+    worst_mean = 0.0
+    for label, queries in categories.items():
+        us = time_lookups(formulary, queries)
+        report(label, us)
+        worst_mean = max(worst_mean, us.mean())
+
+    print(f"Worst mean lookup: {worst_mean / 1000:.3f} ms ({'under' if worst_mean < 1000 else 'OVER'} 1 ms)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import re
+import time
+import argparse
+from typing import List, Dict
+from rule_engine import RuleEngine, DEFAULT_FREQUENCY_PATTERNS, DEFAULT_DOSAGE_PATTERNS
+
+SAMPLE_LINES = [
+    "Tab Amoxicillin 500mg TID for 7 days",
+    "Cap Omeprazole 20 mg OD x 14 days",
+    "Paracetamol 650mg PRN",
+    "Metformin 500 mg BID for 3 months",
+    "Syp Cetirizine 5 ml QHS",
+    "Atorvastatin 10mg once for 30 days",
+    "Insulin glargine 10 units q8h",
+    "Dr. A. Sharma MBBS MD",
+    "Patient: John Doe Age 45",
+    "Vitamin D3 2 tablets weekly for 8 weeks",
+]
+
+def legacy_parse_with_rules(text: str) -> List[Dict]:
+    """The pre-compiled-engine implementation, kept for comparison"""
+    drugs = []
+    lines = text.split('\n')
+
+    for line in lines:
+        line = line.strip()
+        if not line or len(line) < 3:
+            continue
+
+        drug_info = {'drug_name': '', 'dosage': '', 'frequency': '', 'duration': ''}
+
+        for pattern in DEFAULT_DOSAGE_PATTERNS:
+            dosage_match = re.search(pattern, line, re.IGNORECASE)
+            if dosage_match:
+                drug_info['dosage'] = dosage_match.group(0)
+                break
+
+        for pattern, standardized in DEFAULT_FREQUENCY_PATTERNS.items():
+            if re.search(pattern, line, re.IGNORECASE):
+                drug_info['frequency'] = standardized
+                break
+
+        duration_match = re.search(r'(?:for|x)\s*(\d+)\s*(day|week|month)s?', line, re.IGNORECASE)
+        if duration_match:
+            drug_info['duration'] = f"{duration_match.group(1)} {duration_match.group(2)}s"
+
+        if drug_info['dosage']:
+            drug_info['drug_name'] = line.split(drug_info['dosage'])[0].strip()
+        else:
+            drug_info['drug_name'] = ' '.join(line.split()[:4])
+
+        if drug_info['drug_name'] and (drug_info['dosage'] or drug_info['frequency'] or len(lines) == 1):
+            drugs.append(drug_info)
+
+    return drugs
+
+def time_it(fn, text: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark: legacy vs compiled rule parser")
+    parser.add_argument("--lines", type=int, default=200, help="Lines per synthetic prescription")
+    parser.add_argument("--repeat", type=int, default=200, help="Parses per implementation")
+    args = parser.parse_args()
+
+    text = "\n".join(SAMPLE_LINES[i % len(SAMPLE_LINES)] for i in range(args.lines))
+    # Built-in patterns only so both implementations see the same rules
+    engine = RuleEngine()
+
+    legacy_drugs, compiled_drugs = legacy_parse_with_rules(text), engine.parse(text)
+    if len(legacy_drugs) != len(compiled_drugs):
+        print(f"Warning: {len(legacy_drugs)} drugs parsed by legacy vs {len(compiled_drugs)} by compiled")
+    mismatches = sum(1 for a, b in zip(legacy_drugs, compiled_drugs) if a != b)
+    if mismatches:
+        print(f"Warning: {mismatches} line(s) parsed differently")
+
+    legacy = time_it(legacy_parse_with_rules, text, args.repeat)
+    compiled = time_it(engine.parse, text, args.repeat)
+    total_lines = args.lines * args.repeat
+
+    print(f"Lines parsed per implementation: {total_lines}")
+    print(f"Legacy   : {legacy * 1e6 / total_lines:8.2f} us/line")
+    print(f"Compiled : {compiled * 1e6 / total_lines:8.2f} us/line")
+    print(f"Speedup  : {legacy / compiled:8.2f}x")
+
+if __name__ == "__main__":
+    main()
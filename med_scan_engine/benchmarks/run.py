@@ -0,0 +1,254 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Callable, Tuple
+
+import numpy as np
+
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+if ENGINE_DIR not in sys.path:
+    sys.path.insert(0, ENGINE_DIR)
+
+from benchmarks.synth import generate_corpus
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def summarize(latencies: List[float], wall_time: float) -> Dict:
+    """Throughput and latency percentiles (ms) for one stage"""
+    ms = np.array(latencies) * 1000
+    return {
+        'count': len(latencies),
+        'wall_s': round(wall_time, 4),
+        'throughput_per_s': round(len(latencies) / wall_time, 2) if wall_time > 0 else None,
+        'mean_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p90_ms': round(float(np.percentile(ms, 90)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'max_ms': round(float(ms.max()), 3),
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+def quietly(fn: Callable, *args):
+    """Call fn without its console output"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args)
+
+def time_stage(name: str, fn: Callable, inputs) -> Tuple[Dict, list]:
+    """Run fn over inputs one at a time; returns (stats, outputs)"""
+    print(f"  {name} ({len(inputs)} items)...")
+    latencies = []
+    outputs = []
+    start = time.perf_counter()
+    for item in inputs:
+        t0 = time.perf_counter()
+        outputs.append(fn(item))
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - start), outputs
+
+def run_api_load(client, corpus: List[Dict], requests: int, concurrency: int) -> Dict:
+    """End-to-end POST /api/prescriptions/analyze load test"""
+    print(f"  api_analyze ({requests} requests, concurrency {concurrency})...")
+
+    def call(i):
+        item = corpus[i % len(corpus)]
+        t0 = time.perf_counter()
+        response = client.post(
+            "/api/prescriptions/analyze",
+            files={"file": (item['name'], item['image_bytes'], "image/jpeg")}
+        )
+        return time.perf_counter() - t0, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, range(requests)))
+    stats = summarize([r[0] for r in results], time.perf_counter() - start)
+    stats['errors'] = sum(1 for r in results if r[1] != 200)
+    stats['concurrency'] = concurrency
+    return stats
+
+def run_benchmarks(args) -> Dict:
+    print(f"Synthesizing {args.images} prescription images (seed {args.seed})...")
+    corpus = generate_corpus(args.images, args.seed)
+
+    workdir = tempfile.mkdtemp(prefix="medscan_bench_")
+    # main.py creates its SQLite DB and uploads/ relative to the working directory
+    os.chdir(workdir)
+
+    print("Loading models...")
+    import main
+    from database import Base, get_db
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from cli_scanner import export_data, save_annotations
+
+    processor = main.processor
+    nlp_parser = main.nlp_parser
+
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    BenchSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    stages = {}
+    print("Timing stages:")
+
+    stages['preprocess_image'], processed = time_stage(
+        'preprocess_image', processor.preprocess_image, [c['image_bytes'] for c in corpus])
+
+    stages['extract_text'], ocr_output = time_stage('extract_text', processor.extract_text, processed)
+    texts = [text for text, _ in ocr_output]
+
+    stages['parse_prescription'], parsed = time_stage('parse_prescription', nlp_parser.parse_prescription, texts)
+
+    drug_lists = [[d['drug_name'] for d in p['drugs']] for p in parsed]
+    stages['validate_drug_interactions'], _ = time_stage(
+        'validate_drug_interactions', nlp_parser.validate_drug_interactions, drug_lists)
+
+    db = BenchSession()
+    try:
+        stages['db_write'], _ = time_stage(
+            'db_write',
+            lambda item: main.save_prescription(db, None, item[0]['name'], item[1], item[2]),
+            list(zip(corpus, texts, parsed))
+        )
+    finally:
+        db.close()
+
+    annotation_file = os.path.join(workdir, "annotations.json")
+    records = [
+        {
+            "file_name": c['name'],
+            "file_path": c['name'],
+            "timestamp": datetime.now().isoformat(),
+            "raw_text": text,
+            "extracted_drugs": p['drugs'],
+            "alerts": p['alerts'],
+            "status": "auto_generated"
+        }
+        for c, text, p in zip(corpus, texts, parsed)
+    ]
+    quietly(save_annotations, records, annotation_file)
+    for ext in args.export_formats:
+        target = os.path.join(workdir, f"export{ext}")
+        stages[f'export_data{ext}'], _ = time_stage(
+            f'export_data{ext}', lambda _: quietly(export_data, annotation_file, target), range(args.export_repeat))
+
+    if args.api_requests:
+        from fastapi.testclient import TestClient
+
+        def bench_db():
+            session = BenchSession()
+            try:
+                yield session
+            finally:
+                session.close()
+
+        main.app.dependency_overrides[get_db] = bench_db
+        with TestClient(main.app) as client:
+            stages['api_analyze'] = run_api_load(client, corpus, args.api_requests, args.concurrency)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'images': args.images,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'peak_rss_mb': peak_rss_mb()
+        },
+        'stages': stages
+    }
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Compare p50 latency and throughput against a baseline.
+    Returns a list of regressions beyond tolerance (fraction, e.g. 0.1 = 10%).
+    """
+    regressions = []
+    rows = []
+    for name, stats in results['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if not base:
+            rows.append(f"  {name:30s} (no baseline)")
+            continue
+        change = (stats['p50_ms'] - base['p50_ms']) / base['p50_ms'] if base['p50_ms'] else 0.0
+        rows.append(f"  {name:30s} p50 {base['p50_ms']:10.3f} -> {stats['p50_ms']:10.3f} ms ({change:+.1%})")
+        if change > tolerance:
+            regressions.append(f"{name}: p50 {base['p50_ms']} ms -> {stats['p50_ms']} ms ({change:+.1%})")
+
+        base_throughput, throughput = base.get('throughput_per_s'), stats.get('throughput_per_s')
+        if base_throughput and throughput and (base_throughput - throughput) / base_throughput > tolerance:
+            regressions.append(f"{name}: throughput {base_throughput}/s -> {throughput}/s")
+
+    print("\nComparison with baseline:")
+    print("\n".join(rows))
+    return regressions
+
+def print_table(results: Dict):
+    print(f"\n{'stage':30s} {'count':>6s} {'thr/s':>9s} {'p50 ms':>10s} {'p95 ms':>10s} {'p99 ms':>10s} {'rss MB':>8s}")
+    for name, s in results['stages'].items():
+        print(f"{name:30s} {s['count']:6d} {s['throughput_per_s'] or 0:9.2f} {s['p50_ms']:10.3f} "
+              f"{s['p95_ms']:10.3f} {s['p99_ms']:10.3f} {s['peak_rss_mb']:8.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for the MedScan pipeline")
+    parser.add_argument("--images", type=int, default=20, help="Number of synthetic prescriptions")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic corpus")
+    parser.add_argument("--export-formats", nargs="*", default=[".csv", ".xlsx", ".pdf"], help="export_data formats to time")
+    parser.add_argument("--export-repeat", type=int, default=5, help="Exports per format")
+    parser.add_argument("--api-requests", type=int, default=20, help="Requests for the API load test (0 to skip)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent API clients")
+    parser.add_argument("--output", help="Results JSON (default: benchmarks/results/bench_<timestamp>.json)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed p50 slowdown before flagging a regression")
+    args = parser.parse_args()
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    output = os.path.abspath(output)
+    baseline_path = os.path.abspath(args.baseline)
+
+    results = run_benchmarks(args)
+    print_table(results)
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f"\nResults saved to {output}")
+
+    if args.save_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline saved to {baseline_path}")
+    elif os.path.exists(baseline_path):
+        with open(baseline_path, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for r in regressions:
+                print(f"- {r}")
+            sys.exit(1)
+        print("\nNo regressions beyond tolerance.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import csv
+import os
+import random
+import cv2
+import numpy as np
+from typing import List, Dict
+
+FORMULARY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "formulary.csv")
+
+FALLBACK_DRUGS = ["Amoxicillin", "Paracetamol", "Metformin", "Atorvastatin", "Omeprazole", "Cetirizine"]
+FORMS = ["Tab", "Cap", "Syp", "Inj"]
+FREQUENCIES = ["OD", "BID", "TID", "QID", "PRN", "QHS", "1-0-1"]
+UNITS = ["mg", "mg", "mg", "ml", "mcg"]
+
+def load_drug_names() -> List[str]:
+    """Drug names from the local formulary (falls back to a short built-in list)"""
+    if not os.path.exists(FORMULARY_PATH):
+        return FALLBACK_DRUGS
+    with open(FORMULARY_PATH, 'r', encoding='utf-8', newline='') as f:
+        names = [row['name'] for row in csv.DictReader(f) if row.get('name')]
+    return names or FALLBACK_DRUGS
+
+def prescription_lines(rng: random.Random, drug_names: List[str], n_drugs: int) -> List[str]:
+    lines = [
+        f"Dr. {rng.choice(['A.', 'R.', 'S.'])} {rng.choice(['Sharma', 'Patil', 'Khan', 'Rao'])} MBBS MD",
+        f"Patient: {rng.choice(['John', 'Asha', 'Ravi', 'Meera'])} Age {rng.randint(18, 90)}",
+        "Rx",
+    ]
+    for _ in range(n_drugs):
+        lines.append(
+            f"{rng.choice(FORMS)} {rng.choice(drug_names)} {rng.choice([5, 10, 20, 40, 250, 500, 650])}"
+            f"{rng.choice(UNITS)} {rng.choice(FREQUENCIES)} x {rng.randint(3, 30)} days"
+        )
+    return lines
+
+def render_prescription(lines: List[str], width: int, noise: float, blur: int, angle: float,
+                        quality: int = 90) -> bytes:
+    """
+    Render text lines onto a white page and degrade it like a phone photo
+    - noise: std-dev of gaussian pixel noise
+    - blur: gaussian kernel size (0 = none, odd values)
+    - angle: rotation in degrees
+    Returns JPEG bytes
+    """
+    scale = width / 1000
+    line_height = int(50 * scale)
+    height = int(line_height * (len(lines) + 2) * 1.4)
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+
+    for i, line in enumerate(lines):
+        y = int(line_height * (i + 1.5) * 1.4)
+        cv2.putText(page, line, (int(40 * scale), y), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.9 * scale, (20, 20, 20), max(1, int(2 * scale)), cv2.LINE_AA)
+
+    if angle:
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        page = cv2.warpAffine(page, matrix, (width, height), borderValue=(255, 255, 255))
+
+    if blur:
+        page = cv2.GaussianBlur(page, (blur, blur), 0)
+
+    if noise:
+        grain = np.random.default_rng(int(abs(angle) * 1000) + width).normal(0, noise, page.shape)
+        page = np.clip(page.astype(np.float32) + grain, 0, 255).astype(np.uint8)
+
+    ok, encoded = cv2.imencode('.jpg', page, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("Failed to encode synthetic prescription")
+    return encoded.tobytes()
+
+def generate_corpus(count: int, seed: int = 0) -> List[Dict]:
+    """
+    Deterministic set of synthetic prescriptions with varying resolution,
+    noise, blur and rotation.
+    Returns: [{'name', 'image_bytes', 'text', 'params'}]
+    """
+    rng = random.Random(seed)
+    drug_names = load_drug_names()
+    corpus = []
+
+    for i in range(count):
+        lines = prescription_lines(rng, drug_names, rng.randint(1, 6))
+        params = {
+            'width': rng.choice([800, 1200, 1600, 2400]),
+            'noise': rng.choice([0, 4, 8, 16]),
+            'blur': rng.choice([0, 3, 5]),
+            'angle': round(rng.uniform(-4, 4), 2),
+        }
+        corpus.append({
+            'name': f"synthetic_{i:04d}.jpg",
+            'image_bytes': render_prescription(lines, **params),
+            'text': "\n".join(lines),
+            'params': params
+        })
+
+    return corpus
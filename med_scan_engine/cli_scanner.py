@@ -1,19 +1,40 @@
 import argparse
+import cProfile
+import pstats
 import os
 import json
 import csv
+import threading
+import re
+import fnmatch
 import cv2
 import pandas as pd
 from fpdf import FPDF
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Callable
 from tabulate import tabulate
 from processor import PrescriptionProcessor
 from nlp_parser import MedicalNLPParser
+from prefilter import PrescriptionPrefilter
+from metrics import REGISTRY, TraceRecorder, stage_timer
+from pipeline import StagePipeline
 from models import DrugEntity
+from reparse import reparse_prescriptions, load_checkpoint, DEFAULT_CHECKPOINT_PATH
 
 # Initialize Processors lazily in scan_directory
 
+# Timestamped scan results written by the scan command
+ANNOTATION_FILE = re.compile(r'^annotation_\d{8}_\d{6}\.json$')
+
+# Non-interactive scans rewrite the annotation file every SAVE_EVERY records
+SAVE_EVERY = 25
+
+# Records whose drugs a reviewer confirmed or entered by hand
+REVIEWED_STATUSES = ('verified', 'manual_correction')
+
 def flatten_data(data: List[Dict]) -> List[Dict]:
     flat_data = []
     for record in data:
@@ -25,6 +46,7 @@ def flatten_data(data: List[Dict]) -> List[Dict]:
                 "timestamp": record['timestamp'],
                 "status": record['status'],
                 "drug_name": "N/A",
+                "canonical_name": "N/A",
                 "dosage": "N/A",
                 "frequency": "N/A",
                 "duration": "N/A",
@@ -38,6 +60,7 @@ def flatten_data(data: List[Dict]) -> List[Dict]:
                     "timestamp": record['timestamp'],
                     "status": record['status'],
                     "drug_name": d_dict.get('drug_name', ''),
+                    "canonical_name": d_dict.get('canonical_name') or '',
                     "dosage": d_dict.get('dosage', ''),
                     "frequency": d_dict.get('frequency', ''),
                     "duration": d_dict.get('duration', ''),
@@ -135,9 +158,172 @@ def export_data(input_file: str, output_file: str):
     except Exception as e:
         print(f"Failed to export: {e}")
 
-def scan_directory(input_dir: str, output_file: str, interactive: bool = False):
+class ScanAborted(Exception):
+    """Raised when the reviewer quits interactive tagging."""
+
+def analyze_image(file_path: str, processor: PrescriptionProcessor, nlp_parser: MedicalNLPParser,
+                  prefilter: PrescriptionPrefilter = None, cancelled: threading.Event = None) -> Dict:
+    """
+    Reads, pre-filters, OCRs and parses one image.
+    Prints nothing, so it can run in the background while the reviewer is typing.
+    Returns {'outcome': 'record' | 'rejected' | 'no_drugs' | 'cancelled', ...}
+    """
+    filename = os.path.basename(file_path)
+    
+    # reading image
+    with stage_timer("read"), open(file_path, "rb") as image_file:
+        image_bytes = image_file.read()
+    
+    # Pre-filter: skip the expensive pipeline for obvious non-prescriptions
+    if prefilter:
+        with stage_timer("prefilter"):
+            verdict = prefilter.evaluate(image_bytes)
+        if not verdict['accept']:
+            return {'outcome': 'rejected', 'verdict': {"file_name": filename, **verdict}}
+    
+    # Checked between the expensive steps so a quit does not wait for the whole image
+    if cancelled is not None and cancelled.is_set():
+        return {'outcome': 'cancelled'}
+    
+    # OCR Processing
+    processed_img = processor.preprocess_image(image_bytes)
+    if cancelled is not None and cancelled.is_set():
+        return {'outcome': 'cancelled'}
+    raw_text, _ = processor.extract_text(processed_img)
+    if cancelled is not None and cancelled.is_set():
+        return {'outcome': 'cancelled'}
+    
+    # NLP Parsing
+    parsed_result = nlp_parser.parse_prescription(raw_text)
+    return build_record(file_path, raw_text, parsed_result)
+
+def build_record(file_path: str, raw_text: str, parsed_result: Dict) -> Dict:
+    """Annotation record for a parsed image, or the 'no_drugs' outcome."""
+    drugs = parsed_result.get('drugs', [])
+    alerts = parsed_result.get('alerts', [])
+    
+    # Validation: Check if it looks like a prescription
+    if not drugs:
+        return {'outcome': 'no_drugs'}
+    
+    record = {
+        "file_name": os.path.basename(file_path),
+        "file_path": os.path.abspath(file_path),
+        "timestamp": datetime.now().isoformat(),
+        "raw_text": raw_text,
+        "extracted_drugs": drugs,
+        "alerts": alerts,
+        "status": "auto_generated"
+    }
+    return {'outcome': 'record', 'record': record}
+
+def scan_stages(processor: PrescriptionProcessor, nlp_parser: MedicalNLPParser,
+                prefilter: PrescriptionPrefilter = None, workers: int = 4) -> List:
+    """
+    The steps of analyze_image as StagePipeline stages over job dicts:
+    read -> prefilter -> preprocess (thread pool) -> ocr -> nlp.
+    A job that has an 'outcome' (rejected, failed) skips the remaining stages.
+    """
+    # The pre-filter's keyword pass and the OCR stage share processor.reader,
+    # which is not safe to call from two threads at once
+    reader_lock = threading.Lock()
+    
+    def stage(fn: Callable[[Dict], None]) -> Callable[[Dict], Dict]:
+        def run(job: Dict) -> Dict:
+            if 'outcome' not in job:
+                try:
+                    fn(job)
+                except Exception as e:
+                    job.pop('image_bytes', None)
+                    job.pop('image', None)
+                    job.update({'outcome': 'error', 'error': e})
+            return job
+        return run
+    
+    def read(job):
+        with stage_timer("read"), open(job['path'], "rb") as image_file:
+            job['image_bytes'] = image_file.read()
+    
+    def screen(job):
+        with reader_lock, stage_timer("prefilter"):
+            verdict = prefilter.evaluate(job['image_bytes'])
+        if not verdict['accept']:
+            job['outcome'] = 'rejected'
+            job['verdict'] = {"file_name": os.path.basename(job['path']), **verdict}
+            del job['image_bytes']
+    
+    def preprocess(job):
+        job['image'] = processor.preprocess_image(job.pop('image_bytes'))
+    
+    def ocr(job):
+        image = job.pop('image')
+        with reader_lock:
+            job['raw_text'], _ = processor.extract_text(image)
+    
+    def nlp(job):
+        job.update(build_record(job['path'], job['raw_text'], nlp_parser.parse_prescription(job['raw_text'])))
+    
+    stages = [("read", stage(read), 1)]
+    if prefilter:
+        stages.append(("prefilter", stage(screen), 1))
+    stages += [
+        ("preprocess", stage(preprocess), workers),
+        ("ocr", stage(ocr), 1),
+        ("nlp", stage(nlp), 1)
+    ]
+    return stages
+
+def iter_analyzed(paths: List[str], analyze: Callable[[str], Dict], prefetch: int, cancelled: threading.Event):
+    """
+    Yields (path, result) in order; result is an Exception if analysis failed.
+    With prefetch > 0, up to `prefetch` images after the current one are analyzed
+    in a background thread. Closing the generator cancels the pending work.
+    """
+    if prefetch <= 0:
+        for path in paths:
+            try:
+                yield path, analyze(path)
+            except Exception as e:
+                yield path, e
+        return
+    
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+    pending = deque()
+    remaining = iter(paths)
+    try:
+        while True:
+            # Keep the current image plus `prefetch` look-ahead images in flight
+            while len(pending) <= prefetch:
+                path = next(remaining, None)
+                if path is None:
+                    break
+                pending.append((path, executor.submit(analyze, path)))
+            if not pending:
+                break
+            
+            path, future = pending.popleft()
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            yield path, result
+    finally:
+        cancelled.set()
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+def scan_directory(input_dir: str, output_file: str, interactive: bool = False, cascade: bool = False,
+                   prefilter_threshold: float = None, prefetch: int = 2, workers: int = 4,
+                   queue_size: int = 8, profiles: List = None):
     """
     Scans a directory for images, processes them, and optionally allows for manual annotation.
+    In interactive mode the next `prefetch` images are processed in the background
+    while the current one is being reviewed.
+    Otherwise images stream through a stage pipeline (read, prefilter, `workers`
+    preprocessing threads, OCR, NLP) with queues of at most `queue_size` images.
+    If `profiles` is a list, the pipeline threads are profiled with cProfile
+    and their profiles appended to it.
     """
     if not os.path.exists(input_dir):
         print(f"Error: Directory '{input_dir}' not found.")
@@ -151,8 +337,15 @@ def scan_directory(input_dir: str, output_file: str, interactive: bool = False):
         return
 
     print("Initializing AI models (this may take a moment)...")
-    processor = PrescriptionProcessor()
+    processor = PrescriptionProcessor(cascade=cascade)
     nlp_parser = MedicalNLPParser()
+    
+    # Optional cheap pre-filter to reject obvious non-prescriptions early
+    prefilter = None
+    if prefilter_threshold is not None:
+        prefilter = PrescriptionPrefilter(reader=processor.reader, threshold=prefilter_threshold,
+                                          formulary=nlp_parser.formulary)
+    rejected = []
 
     print(f"Found {len(files)} images. Starting scan...\n")
     
@@ -167,59 +360,144 @@ def scan_directory(input_dir: str, output_file: str, interactive: bool = False):
         except:
             print("Starting with empty annotation set.")
 
-    for i, filename in enumerate(files):
-        file_path = os.path.join(input_dir, filename)
-        print(f"[{i+1}/{len(files)}] Processing {filename}...")
+    cancelled = threading.Event()
+    paths = [os.path.join(input_dir, filename) for filename in files]
+    pipeline = None
+    if interactive:
+        analyze = lambda path: analyze_image(path, processor, nlp_parser, prefilter, cancelled)
+        results = iter_analyzed(paths, analyze, prefetch, cancelled)
+    else:
+        pipeline = StagePipeline(scan_stages(processor, nlp_parser, prefilter, workers), queue_size,
+                                 profile=profiles is not None)
         
+        def pipelined():
+            with closing(pipeline.run({'path': path} for path in paths)) as jobs:
+                for job in jobs:
+                    yield job['path'], job
+        results = pipelined()
+    unsaved = 0
+    
+    with closing(results):
         try:
-            # reading image
-            with open(file_path, "rb") as image_file:
-                image_bytes = image_file.read()
-            
-            # OCR Processing
-            raw_text, _ = processor.process_prescription(image_bytes)
-            
-            # NLP Parsing
-            parsed_result = nlp_parser.parse_prescription(raw_text)
-            drugs = parsed_result.get('drugs', [])
-            alerts = parsed_result.get('alerts', [])
-
-            # Validation: Check if it looks like a prescription
-            if not drugs:
-                print(f"⚠️  ALERT: No medication found in {filename}.")
-                print(f"   -> This does not appear to be a valid prescription or the text is illegible.")
-                print(f"   -> Skipping save for this file.")
-                continue
-
-            record = {
-                "file_name": filename,
-                "file_path": os.path.abspath(file_path),
-                "timestamp": datetime.now().isoformat(),
-                "raw_text": raw_text,
-                "extracted_drugs": drugs,
-                "alerts": alerts,
-                "status": "auto_generated"
-            }
-            
-            if interactive:
-                record = interactive_tagging(record)
-                # If during interactive mode user clears all drugs, we treat it as skipped/invalid
-                if not record.get('extracted_drugs'):
-                    print("   -> Marked as invalid/skipped by user.")
+            for i, (file_path, result) in enumerate(results):
+                filename = os.path.basename(file_path)
+                print(f"[{i+1}/{len(files)}] Processing {filename}...")
+                
+                if isinstance(result, Exception):
+                    print(f"Error processing {filename}: {result}")
                     continue
-            else:
-                display_record(record)
-            
-            all_records.append(record)
-            
-            # Save incrementally
-            save_annotations(all_records, output_file)
-            
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
+                
+                if result['outcome'] == 'error':
+                    print(f"Error processing {filename}: {result['error']}")
+                    continue
+                
+                if result['outcome'] == 'rejected':
+                    verdict = result['verdict']
+                    print(f"⏭️  Rejected {filename}: {verdict['reason']} (score {verdict['score']}, {verdict['elapsed_ms']} ms)")
+                    rejected.append(verdict)
+                    continue
+                
+                if result['outcome'] == 'no_drugs':
+                    print(f"⚠️  ALERT: No medication found in {filename}.")
+                    print(f"   -> This does not appear to be a valid prescription or the text is illegible.")
+                    print(f"   -> Skipping save for this file.")
+                    continue
+                
+                if result['outcome'] != 'record':
+                    continue
+                
+                try:
+                    record = result['record']
+                    if interactive:
+                        record = interactive_tagging(record)
+                        # If during interactive mode user clears all drugs, we treat it as skipped/invalid
+                        if not record.get('extracted_drugs'):
+                            print("   -> Marked as invalid/skipped by user.")
+                            continue
+                    else:
+                        display_record(record)
+                    
+                    all_records.append(record)
+                    unsaved += 1
+                    
+                    # Save incrementally (in batches when nobody is waiting on each record)
+                    if interactive or unsaved >= SAVE_EVERY:
+                        save_annotations(all_records, output_file)
+                        unsaved = 0
+                    
+                except ScanAborted:
+                    raise
+                except Exception as e:
+                    print(f"Error processing {filename}: {e}")
+        except (ScanAborted, KeyboardInterrupt, EOFError):
+            print("\nScan stopped by user. Cancelling background processing...")
+        finally:
+            if unsaved:
+                save_annotations(all_records, output_file)
+    
+    if pipeline:
+        report_pipeline(pipeline)
+        if profiles is not None:
+            profiles.extend(pipeline.profiles)
+
+    if prefilter:
+        report_rejections(rejected, output_file)
 
     print(f"\nScan complete. annotations saved to {output_file}")
 
+def report_pipeline(pipeline: StagePipeline):
+    """Prints per-stage pipeline statistics; the bottleneck has the most busy time per worker."""
+    table_data = [
+        [r['stage'], r['workers'], r['items'], f"{r['busy_s']:.2f}", f"{r['utilization'] * 100:.0f}%",
+         f"{r['starved_s']:.2f}", f"{r['blocked_s']:.2f}", f"{r['queue_mean']:.1f}", r['queue_max']]
+        for r in pipeline.stats()
+    ]
+    print("\n--- Pipeline Stages ---")
+    print(tabulate(table_data, headers=["Stage", "Workers", "Items", "Busy (s)", "Util", "Starved (s)",
+                                        "Blocked (s)", "Queue avg", "Queue max"], tablefmt="grid"))
+    print(f"Bottleneck: {pipeline.bottleneck()}")
+
+def report_rejections(rejected: List[Dict], output_file: str):
+    """Prints and saves the list of images rejected by the pre-filter."""
+    print(f"\nPre-filter rejected {len(rejected)} image(s).")
+    if not rejected:
+        return
+    
+    table_data = [[r['file_name'], r['reason'], r['score'], r['elapsed_ms']] for r in rejected]
+    print(tabulate(table_data, headers=["File", "Reason", "Score", "Time (ms)"], tablefmt="grid"))
+    
+    report_file = os.path.splitext(output_file)[0] + "_rejected.json"
+    save_annotations(rejected, report_file)
+    print(f"Rejection report saved to {report_file}")
+
+def report_profile(output_file: str, profiler: cProfile.Profile = None, thread_profiles: List = ()):
+    """
+    Prints the per-stage time breakdown and writes the trace (and cProfile) files.
+    thread_profiles (pipeline workers) are merged into the profiler's stats.
+    """
+    rows = REGISTRY.stage_breakdown()
+    grand_total = sum(r['total_s'] for r in rows) or 1.0
+    table_data = [
+        [r['stage'], r['count'], f"{r['total_s']:.3f}", f"{r['total_s'] / r['count'] * 1000:.1f}",
+         f"{r['total_s'] / grand_total * 100:.1f}%"]
+        for r in rows
+    ]
+    print("\n--- Stage Breakdown ---")
+    print(tabulate(table_data, headers=["Stage", "Calls", "Total (s)", "Mean (ms)", "Share"], tablefmt="grid"))
+    
+    base = os.path.splitext(output_file)[0]
+    if REGISTRY.tracer is not None:
+        trace_file = base + "_trace.json"
+        REGISTRY.tracer.save(trace_file)
+        print(f"Trace saved to {trace_file} (open in chrome://tracing or https://ui.perfetto.dev)")
+    
+    if profiler is not None:
+        profile_file = base + "_cprofile.prof"
+        stats = pstats.Stats(profiler, *thread_profiles)
+        stats.dump_stats(profile_file)
+        print(f"cProfile stats saved to {profile_file} (flamegraph: snakeviz / flameprof)")
+        stats.sort_stats("cumulative").print_stats(15)
+
 def display_record(record: Dict):
     print("\n--- Extracted Data ---")
     print(f"File: {record['file_name']}")
@@ -233,12 +511,13 @@ def display_record(record: Dict):
             d_dict = d if isinstance(d, dict) else d.dict()
             table_data.append([
                 d_dict.get('drug_name', 'N/A'),
+                d_dict.get('canonical_name') or 'N/A',
                 d_dict.get('dosage', 'N/A'),
                 d_dict.get('frequency', 'N/A'),
                 d_dict.get('duration', 'N/A')
             ])
         
-        print(tabulate(table_data, headers=["Drug Name", "Dosage", "Frequency", "Duration"], tablefmt="grid"))
+        print(tabulate(table_data, headers=["Drug Name", "Normalized", "Dosage", "Frequency", "Duration"], tablefmt="grid"))
     else:
         print("No drugs detected.")
     
@@ -252,9 +531,11 @@ def interactive_tagging(record: Dict) -> Dict:
     display_record(record)
     
     print("\n[Interactive Tagging]")
-    choice = input("Is the extraction correct? (y/n/skip): ").strip().lower()
+    choice = input("Is the extraction correct? (y/n/skip/q to quit): ").strip().lower()
     
-    if choice == 'y':
+    if choice == 'q':
+        raise ScanAborted()
+    elif choice == 'y':
         record['status'] = 'verified'
         return record
     elif choice == 'skip':
@@ -288,6 +569,227 @@ def interactive_tagging(record: Dict) -> Dict:
     
     return record
 
+def latest_annotation_file(results_dir: str = "results") -> str:
+    """Newest results/annotation_YYYYMMDD_HHMMSS.json (ignores rejection/trace files)."""
+    if not os.path.exists(results_dir):
+        return None
+    json_files = [f for f in os.listdir(results_dir) if ANNOTATION_FILE.match(f)]
+    if not json_files:
+        return None
+    json_files.sort(reverse=True)
+    return os.path.join(results_dir, json_files[0])
+
+def iter_records(filepath: str, chunk_size: int = 1 << 16):
+    """
+    Streams the records of a JSON array file one at a time, so only one
+    record (plus a read buffer) is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    with open(filepath, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size)
+        pos = 0
+        eof = not buffer
+        
+        def skip(chars: str):
+            nonlocal buffer, pos, eof
+            while True:
+                while pos < len(buffer) and buffer[pos] in chars:
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                buffer, pos = f.read(chunk_size), 0
+                eof = not buffer
+        
+        skip(" \t\r\n")
+        if eof or buffer[pos] != '[':
+            raise ValueError(f"{filepath} is not a JSON array of records")
+        pos += 1
+        
+        read_size = chunk_size
+        while True:
+            skip(" \t\r\n,")
+            if eof:
+                raise ValueError(f"{filepath} ended before the closing ']'")
+            if buffer[pos] == ']':
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Record continues past the buffer: read more (growing for huge records)
+                more = f.read(read_size)
+                if not more:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0
+                read_size *= 2
+                continue
+            read_size = chunk_size
+            pos = end
+            yield record
+            # Drop the consumed part of the buffer
+            if pos >= chunk_size:
+                buffer, pos = buffer[pos:], 0
+
+def record_matches(record: Dict, filters: Dict) -> bool:
+    """Applies the view filters (status, drug, has_alert, file_glob) to one record."""
+    if filters.get('status') and record.get('status') != filters['status']:
+        return False
+    if filters.get('has_alert') and not record.get('alerts'):
+        return False
+    if filters.get('file_glob') and not fnmatch.fnmatch(record.get('file_name', ''), filters['file_glob']):
+        return False
+    if filters.get('drug'):
+        needle = filters['drug'].lower()
+        for d in record.get('extracted_drugs', []):
+            names = (d.get('drug_name') or '', d.get('canonical_name') or '')
+            if any(needle in name.lower() for name in names):
+                break
+        else:
+            return False
+    return True
+
+def view_annotations(filepath: str, filters: Dict, page: int = 1, page_size: int = 20):
+    """Displays one page of the records matching filters, streaming the file."""
+    page = max(page, 1)
+    page_size = max(page_size, 1)
+    first = (page - 1) * page_size
+    
+    matched = 0
+    shown = 0
+    has_more = False
+    for record in iter_records(filepath):
+        if not record_matches(record, filters):
+            continue
+        if matched >= first + page_size:
+            has_more = True
+            break
+        if matched >= first:
+            display_record(record)
+            shown += 1
+        matched += 1
+    
+    if shown:
+        print(f"Page {page}: records {first + 1}-{first + shown} of the matches in {filepath}")
+    else:
+        print(f"No matching records on page {page} of {filepath}.")
+    if has_more:
+        print(f"More records available: --page {page + 1}")
+
+def summarize_annotations(filepath: str, filters: Dict):
+    """Aggregates counts over the matching records in a single streaming pass."""
+    total = 0
+    matched = 0
+    with_alerts = 0
+    drug_count = 0
+    by_status = Counter()
+    by_drug = Counter()
+    
+    for record in iter_records(filepath):
+        total += 1
+        if not record_matches(record, filters):
+            continue
+        matched += 1
+        by_status[record.get('status', 'unknown')] += 1
+        if record.get('alerts'):
+            with_alerts += 1
+        for d in record.get('extracted_drugs', []):
+            drug_count += 1
+            by_drug[d.get('canonical_name') or d.get('drug_name') or 'unknown'] += 1
+    
+    print(f"\n--- Summary: {filepath} ---")
+    print(tabulate([
+        ["Records", total],
+        ["Matching", matched],
+        ["With alerts", with_alerts],
+        ["Drugs extracted", drug_count]
+    ], tablefmt="grid"))
+    if by_status:
+        print(tabulate(by_status.most_common(), headers=["Status", "Records"], tablefmt="grid"))
+    if by_drug:
+        print(tabulate(by_drug.most_common(10), headers=["Top Drugs", "Count"], tablefmt="grid"))
+
+def reparse_annotations(filepath: str, nlp_parser: MedicalNLPParser, batch_size: int = 256,
+                        include_reviewed: bool = False):
+    """
+    Re-parses the raw_text of every record in an annotation file with the
+    current parser (no OCR) and rewrites the file in place.
+    Records a reviewer verified or corrected are kept unless include_reviewed.
+    """
+    tmp_path = f"{filepath}.tmp"
+    counts = Counter()
+    
+    def flush(batch: List[Dict], out):
+        todo = [r for r in batch
+                if r.get('raw_text') is not None
+                and (include_reviewed or r.get('status') not in REVIEWED_STATUSES)]
+        parsed = nlp_parser.parse_prescriptions([r['raw_text'] for r in todo])
+        for record, parsed_result in zip(todo, parsed):
+            record['extracted_drugs'] = parsed_result.get('drugs', [])
+            record['alerts'] = parsed_result.get('alerts', [])
+            record['status'] = 'auto_generated'
+            record['reparsed_at'] = datetime.now().isoformat()
+        counts['reparsed'] += len(todo)
+        counts['kept'] += len(batch) - len(todo)
+        for record in batch:
+            out.write(",\n" if counts['written'] else "\n")
+            out.write(json.dumps(record, indent=4, default=str))
+            counts['written'] += 1
+    
+    # Streamed through a temp file, so the original stays intact until the end
+    with open(tmp_path, 'w') as out:
+        out.write("[")
+        batch = []
+        for record in iter_records(filepath):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                flush(batch, out)
+                batch = []
+        if batch:
+            flush(batch, out)
+        out.write("\n]")
+    os.replace(tmp_path, filepath)
+    
+    print(f"Re-parsed {counts['reparsed']} records in {filepath} "
+          f"({counts['kept']} reviewed records kept)")
+
+def reparse_database(nlp_parser: MedicalNLPParser, batch_size: int = 256, resume: bool = False,
+                     limit: int = None, checkpoint_path: str = DEFAULT_CHECKPOINT_PATH):
+    """Re-parses stored prescriptions in the database, resumable via a checkpoint file."""
+    from database import SessionLocal, init_db
+    
+    start_after = 0
+    if resume:
+        start_after = load_checkpoint(checkpoint_path).get('last_id', 0)
+        print(f"Resuming after prescription id {start_after}")
+    
+    def progress(state: Dict):
+        print(f"  {state['processed']} prescriptions re-parsed "
+              f"({state['changed']} changed), last id {state['last_id']}")
+    
+    init_db()
+    db = SessionLocal()
+    try:
+        result = reparse_prescriptions(db, nlp_parser, batch_size=batch_size, start_after=start_after,
+                                       limit=limit, checkpoint_path=checkpoint_path, on_batch=progress)
+    finally:
+        db.close()
+    
+    print(tabulate([
+        ["Re-parsed", result['processed']],
+        ["Changed", result['changed']],
+        ["Unchanged", result['unchanged']],
+        ["Medications updated", result['medications']['updated']],
+        ["Medications added", result['medications']['added']],
+        ["Medications discontinued", result['medications']['discontinued']],
+        ["Medications deleted", result['medications']['deleted']]
+    ], tablefmt="grid"))
+    
+    if result['done']:
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        print("Re-parse complete.")
+    else:
+        print(f"Stopped after id {result['last_id']}; continue with: reparse --db --resume")
+
 def save_annotations(records: List[Dict], filepath: str):
     """Saves the annotations list to a JSON file."""
     try:
@@ -299,12 +801,32 @@ def save_annotations(records: List[Dict], filepath: str):
 def main():
     parser = argparse.ArgumentParser(description="Medical Prescription CLI Scanner & Tagger")
     
-    parser.add_argument("command", choices=["scan", "view", "export"], help="Command to execute")
+    parser.add_argument("command", choices=["scan", "view", "export", "reparse"], help="Command to execute")
     parser.add_argument("--dir", help="Directory containing prescription images", default="uploads")
     parser.add_argument("--output", help="Output file path (for export) or file to view", default="annotations.json")
-    parser.add_argument("--input", help="Input JSON file for export command", default="annotations.json")
+    parser.add_argument("--input", help="Input JSON file for export/reparse commands", default="annotations.json")
     parser.add_argument("--interactive", action="store_true", help="Enable interactive tagging mode")
     parser.add_argument("--export-to", help="Immediately export results to this file after scanning (e.g. report.pdf)")
+    parser.add_argument("--cascade", action="store_true", help="Fast OCR: low-res pass first, full-res re-recognition only for low-confidence text")
+    parser.add_argument("--prefilter", action="store_true", help="Reject obvious non-prescription images before running the full pipeline")
+    parser.add_argument("--prefetch", type=int, default=2, help="Interactive mode: images to process ahead in the background")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="Batch scan: image preprocessing threads")
+    parser.add_argument("--queue-size", type=int, default=8, help="Batch scan: max images waiting between pipeline stages")
+    parser.add_argument("--page", type=int, default=1, help="View: page number (1-based)")
+    parser.add_argument("--page-size", type=int, default=20, help="View: records per page")
+    parser.add_argument("--status", help="View: only records with this status (e.g. verified)")
+    parser.add_argument("--drug", help="View: only records containing this drug (substring, case-insensitive)")
+    parser.add_argument("--has-alert", action="store_true", help="View: only records with alerts")
+    parser.add_argument("--file-glob", help="View: only records whose file name matches this glob (e.g. 'rx_2026*')")
+    parser.add_argument("--summary", action="store_true", help="View: aggregate counts instead of listing records")
+    parser.add_argument("--db", action="store_true", help="Reparse: re-parse prescriptions stored in the database instead of an annotation file")
+    parser.add_argument("--batch-size", type=int, default=256, help="Reparse: texts parsed (and committed) per batch")
+    parser.add_argument("--resume", action="store_true", help="Reparse --db: continue an interrupted run from its checkpoint")
+    parser.add_argument("--limit", type=int, help="Reparse --db: stop after this many prescriptions")
+    parser.add_argument("--include-reviewed", action="store_true", help="Reparse: also re-parse verified / manually corrected records")
+    parser.add_argument("--profile", action="store_true", help="Print a per-stage time breakdown and write a trace file")
+    parser.add_argument("--cprofile", action="store_true", help="With --profile: also record cProfile stats for flamegraphs")
+    parser.add_argument("--prefilter-threshold", type=float, default=0.3, help="Minimum prescription keyword score for the pre-filter (0-1)")
 
     args = parser.parse_args()
     
@@ -320,7 +842,24 @@ def main():
         output_path = os.path.join(results_dir, output_filename)
         
         print(f"Starting scan. Results will be saved to: {output_path}")
-        scan_directory(args.dir, output_path, args.interactive)
+        prefilter_threshold = args.prefilter_threshold if args.prefilter else None
+        
+        profiler = None
+        thread_profiles = None
+        if args.profile:
+            REGISTRY.tracer = TraceRecorder()
+            if args.cprofile:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                thread_profiles = []
+        
+        scan_directory(args.dir, output_path, args.interactive, args.cascade, prefilter_threshold, args.prefetch,
+                       args.workers, args.queue_size, thread_profiles)
+        
+        if args.profile:
+            if profiler:
+                profiler.disable()
+            report_profile(output_path, profiler, thread_profiles or ())
 
         # Auto-export if requested
         if args.export_to:
@@ -342,20 +881,22 @@ def main():
         target_file = args.output
         # Smart default: If default "annotations.json" missing, try latest in results
         if args.output == "annotations.json" and not os.path.exists("annotations.json"):
-            if os.path.exists("results"):
-                files = os.listdir("results")
-                json_files = [f for f in files if f.startswith("annotation_") and f.endswith(".json")]
-                if json_files:
-                    json_files.sort(reverse=True)
-                    target_file = os.path.join("results", json_files[0])
-                    print(f"No specific file provided. Viewing latest: {target_file}")
+            latest = latest_annotation_file()
+            if latest:
+                target_file = latest
+                print(f"No specific file provided. Viewing latest: {target_file}")
         
         if os.path.exists(target_file):
-            with open(target_file, 'r') as f:
-                data = json.load(f)
-                print(f"Loaded {len(data)} records from {target_file}")
-                for record in data:
-                    display_record(record)
+            filters = {
+                'status': args.status,
+                'drug': args.drug,
+                'has_alert': args.has_alert,
+                'file_glob': args.file_glob
+            }
+            if args.summary:
+                summarize_annotations(target_file, filters)
+            else:
+                view_annotations(target_file, filters, args.page, args.page_size)
         else:
             print(f"File {target_file} not found.")
 
@@ -375,15 +916,31 @@ def main():
 
         # Smart default for input
         if args.input == "annotations.json" and not os.path.exists("annotations.json"):
-             if os.path.exists("results"):
-                files = os.listdir("results")
-                json_files = [f for f in files if f.startswith("annotation_") and f.endswith(".json")]
-                if json_files:
-                    json_files.sort(reverse=True)
-                    input_file = os.path.join("results", json_files[0])
-                    print(f"No input file provided. Using latest: {input_file}")
+            latest = latest_annotation_file()
+            if latest:
+                input_file = latest
+                print(f"No input file provided. Using latest: {input_file}")
 
         export_data(input_file, target_output)
 
+    elif args.command == "reparse":
+        print("Initializing AI models (this may take a moment)...")
+        nlp_parser = MedicalNLPParser()
+        
+        if args.db:
+            reparse_database(nlp_parser, args.batch_size, args.resume, args.limit)
+        else:
+            input_file = args.input
+            if args.input == "annotations.json" and not os.path.exists("annotations.json"):
+                latest = latest_annotation_file()
+                if latest:
+                    input_file = latest
+                    print(f"No input file provided. Using latest: {input_file}")
+            
+            if os.path.exists(input_file):
+                reparse_annotations(input_file, nlp_parser, args.batch_size, args.include_reviewed)
+            else:
+                print(f"File {input_file} not found.")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,328 @@
+import re
+import csv
+import os
+from collections import deque
+from functools import lru_cache
+from typing import List, Dict, Optional
+
+import numpy as np
+
+DEFAULT_FORMULARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "formulary.csv")
+
+TOKEN = re.compile(r'[a-z0-9]+')
+
+def normalize_name(name: str) -> str:
+    """Lowercase and collapse everything that is not a letter or digit"""
+    return " ".join(TOKEN.findall(name.lower()))
+
+def char_masks(query: str) -> Dict[str, int]:
+    """Bit i of masks[c] is set where query[i] == c (for myers_distance)"""
+    masks = {}
+    for i, ch in enumerate(query):
+        masks[ch] = masks.get(ch, 0) | (1 << i)
+    return masks
+
+def myers_distance(masks: Dict[str, int], m: int, name: str) -> int:
+    """
+    Edit distance between a query of length m (as char_masks) and name,
+    with Myers / Hyyro bit-parallel rows held in Python ints.
+    """
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for ch in name:
+        eq = masks.get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        # Global distance: the first row grows by one per name character
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return score
+
+def trigrams(text: str) -> List[str]:
+    padded = f" {text} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+def batch_levenshtein(query: str, chars: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Edit distance from query to many names at once (Myers / Hyyro bit-parallel
+    algorithm, vectorized over names).
+    chars: (names, width) uint8 character codes, zero padded; lengths: name lengths
+    query must be 1-64 ASCII characters (normalize_name output).
+    """
+    m = len(query)
+    mask = np.uint64((1 << m) - 1)
+    high = np.uint64(m - 1)
+    one = np.uint64(1)
+    peq = np.zeros(256, dtype=np.uint64)
+    for i, ch in enumerate(query.encode('ascii')):
+        peq[ch] |= np.uint64(1 << i)
+
+    pv = np.full(len(chars), mask, dtype=np.uint64)
+    mv = np.zeros(len(chars), dtype=np.uint64)
+    score = np.full(len(chars), m, dtype=np.int64)
+    # Zero-length names are m edits away; longer ones are read off at their own length
+    distances = score.copy()
+    for j in range(int(lengths.max(initial=0))):
+        eq = peq[chars[:, j]]
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        score += ((ph >> high) & one).astype(np.int64)
+        score -= ((mh >> high) & one).astype(np.int64)
+        # Global distance: the first row grows by one per name character
+        ph = (ph << one) | one
+        mh = mh << one
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv
+        ended = lengths == j + 1
+        distances[ended] = score[ended]
+    return distances
+
+class Formulary:
+    def __init__(self, entries: Dict[str, str], max_distance: int = 2, min_score: float = 0.75,
+                 cache_size: int = 50000):
+        """
+        Local drug formulary for OCR drug-name normalization.
+        entries: name (generic or brand) -> canonical generic name
+        - Exact multi-pattern scanning with a token-level Aho-Corasick automaton
+        - Fuzzy matching through a character trigram index + bounded edit distance
+        - Repeated OCR tokens are memoized
+        """
+        self.max_distance = max_distance
+        self.min_score = min_score
+
+        # Ordered by length (stable), so the names of a length range are a contiguous id range
+        normalized = sorted(
+            ((normalize_name(name), canonical or name) for name, canonical in entries.items()),
+            key=lambda item: len(item[0])
+        )
+        self.names = [key for key, _ in normalized if key]
+        self.canonical = [canonical for key, canonical in normalized if key]
+
+        self._build_automaton()
+        self._build_trigram_index()
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_FORMULARY_PATH, **kwargs) -> "Formulary":
+        """
+        Load a CSV formulary with columns: name, canonical
+        (an empty canonical means the name is already the generic name)
+        """
+        entries = {}
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                name = (row.get('name') or '').strip()
+                if name:
+                    entries[name] = (row.get('canonical') or '').strip() or name
+        return cls(entries, **kwargs)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _build_automaton(self):
+        """Aho-Corasick over word tokens, so matches always fall on word boundaries"""
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]  # node -> [(token_count, name_id)]
+
+        for name_id, name in enumerate(self.names):
+            node = 0
+            tokens = name.split()
+            for token in tokens:
+                nxt = self._goto[node].get(token)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][token] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                node = nxt
+            self._output[node].append((len(tokens), name_id))
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(token, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def _build_trigram_index(self):
+        """
+        trigram -> (array of name ids, start offset of each name length in it),
+        plus per-name lengths and character codes for vectorized edit distances
+        """
+        self._exact = {}
+        postings = {}
+        for name_id, name in enumerate(self.names):
+            self._exact.setdefault(name, name_id)
+            for gram in set(trigrams(name)):
+                postings.setdefault(gram, []).append(name_id)
+
+        self._lengths = np.array([len(name) for name in self.names], dtype=np.int32)
+        width = int(self._lengths.max(initial=0))
+        # Ids are ordered by length, so names of length >= L start at _length_start[L]
+        self._length_start = np.searchsorted(self._lengths, np.arange(width + 2)).tolist()
+        self._trigrams = {}
+        for gram, ids in postings.items():
+            ids = np.array(ids, dtype=np.int32)
+            self._trigrams[gram] = (ids, np.searchsorted(self._lengths[ids], np.arange(width + 2)).tolist())
+
+        self._chars = np.zeros((len(self.names), width), dtype=np.uint8)
+        for name_id, name in enumerate(self.names):
+            self._chars[name_id, :len(name)] = np.frombuffer(name.encode('ascii'), dtype=np.uint8)
+
+    def scan(self, text: str) -> List[Dict]:
+        """
+        Find every formulary name in text (exact, case and punctuation insensitive).
+        Returns: [{'canonical_name', 'matched', 'start', 'end', 'match_score'}]
+        with start/end as character offsets into text
+        """
+        spans = [(m.start(), m.end(), m.group(0)) for m in TOKEN.finditer(text.lower())]
+        hits = []
+        node = 0
+        for i, (_, end, token) in enumerate(spans):
+            while node and token not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(token, 0)
+            for token_count, name_id in self._output[node]:
+                start = spans[i - token_count + 1][0]
+                hits.append({
+                    'canonical_name': self.canonical[name_id],
+                    'matched': text[start:end],
+                    'start': start,
+                    'end': end,
+                    'match_score': 1.0
+                })
+        return hits
+
+    def _lookup(self, token: str) -> Optional[Dict]:
+        """
+        Best formulary entry for a single OCR token or phrase, exact or fuzzy.
+        Returns: {'canonical_name', 'matched', 'match_score'} or None
+        """
+        query = normalize_name(token)
+        if len(query) < 3:
+            return None
+
+        exact = self._exact.get(query)
+        if exact is not None:
+            return {'canonical_name': self.canonical[exact], 'matched': query, 'match_score': 1.0}
+
+        # Largest distance that can still reach min_score, per name length:
+        # d <= (1 - min_score) * max(len(query), len(name)) and d >= length difference
+        n = len(query)
+        top = len(self._length_start) - 2
+        allowed = [0] * (min(n + self.max_distance, top) + 1)
+        for length in range(max(1, n - self.max_distance), len(allowed)):
+            max_distance = min(self.max_distance, int((1 - self.min_score) * max(n, length) + 1e-9))
+            if max_distance >= max(1, abs(length - n)):
+                allowed[length] = max_distance
+        if max(allowed) < 1:
+            return None
+        limits_by_length = np.array(allowed)
+
+        grams = set(trigrams(query))
+        masks = char_masks(query)
+        found = []  # (distance, -shared trigrams, name id)
+        previous = None
+        # Verify in tiers: a name within d edits differs in length by <= d and
+        # shares >= len(grams) - 3d trigrams (each edit changes at most 3), so
+        # once a tier finds a name within d edits no untested name is closer
+        for d in range(1, max(allowed) + 1):
+            lengths = [length for length, limit in enumerate(allowed) if limit >= d and abs(length - n) <= d]
+            if not lengths:
+                continue
+            # Usable lengths are contiguous, so their names are one id range
+            low, high = lengths[0], lengths[-1] + 1
+            min_shared = max(1, len(grams) - 3 * d)
+            ids, shared = self._candidates(grams, low, high, min_shared)
+            names_lengths = self._lengths[ids]
+            if previous is not None:
+                # Skip names the previous tier already verified
+                p_low, p_high, p_shared = previous
+                fresh = ~((names_lengths >= p_low) & (names_lengths < p_high) & (shared >= p_shared))
+                ids, shared, names_lengths = ids[fresh], shared[fresh], names_lengths[fresh]
+            previous = (low, high, min_shared)
+            if not len(ids):
+                continue
+
+            limits = limits_by_length[names_lengths]
+            if len(ids) > 32 and n <= 64:
+                distances = batch_levenshtein(query, self._chars[ids], names_lengths)
+            else:
+                distances = np.array([myers_distance(masks, n, self.names[i]) for i in ids.tolist()])
+            within = distances <= limits
+            found.extend(zip(distances[within].tolist(), (-shared[within]).tolist(), ids[within].tolist()))
+            if any(distance <= d for distance, _, _ in found):
+                break
+
+        if not found:
+            return None
+        # Closest first, then most shared trigrams
+        best_distance, _, best = min(found)
+
+        score = 1 - best_distance / max(n, len(self.names[best]))
+        if score < self.min_score:
+            return None
+
+        return {
+            'canonical_name': self.canonical[best],
+            'matched': self.names[best],
+            'match_score': round(score, 3)
+        }
+
+    def _candidates(self, grams, low: int, high: int, min_shared: int):
+        """
+        Ids and shared trigram counts of the names of length low..high-1
+        that share at least min_shared of the query's grams
+        """
+        lo, hi = self._length_start[low], self._length_start[high]
+        slices = []
+        for gram in grams:
+            entry = self._trigrams.get(gram)
+            if entry is not None:
+                ids, offsets = entry
+                if offsets[high] > offsets[low]:
+                    slices.append(ids[offsets[low]:offsets[high]])
+        if len(slices) < min_shared:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        counts = np.bincount(np.concatenate(slices) - lo, minlength=hi - lo)
+        ids = np.flatnonzero(counts >= min_shared)
+        return ids + lo, counts[ids]
+
+    def normalize(self, drug_name: str) -> Optional[Dict]:
+        """
+        Map a raw extracted drug name to its canonical formulary name.
+        Exact hits inside the text win, otherwise the best fuzzy token match.
+        """
+        if not drug_name:
+            return None
+
+        hits = self.scan(drug_name)
+        if hits:
+            longest = max(hits, key=lambda hit: hit['end'] - hit['start'])
+            return {k: longest[k] for k in ('canonical_name', 'matched', 'match_score')}
+
+        best = None
+        for token in TOKEN.findall(drug_name.lower()):
+            if len(token) < 4 or token.isdigit():
+                continue
+            match = self.lookup(token)
+            if match and (best is None or match['match_score'] > best['match_score']):
+                best = match
+        return best
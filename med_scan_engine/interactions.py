@@ -0,0 +1,116 @@
+import csv
+import os
+from typing import List, Dict, Iterable, Tuple, Optional
+from formulary import normalize_name
+
+DEFAULT_INTERACTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "interactions.csv")
+
+# Used when no interaction dataset is available
+DEFAULT_INTERACTIONS = [
+    ('Warfarin', 'Aspirin', 'major', 'Increased bleeding risk'),
+    ('Metformin', 'Alcohol', 'major', 'Risk of lactic acidosis'),
+]
+
+SEVERITY_RANK = {'minor': 1, 'moderate': 2, 'major': 3, 'contraindicated': 4}
+
+class InteractionIndex:
+    def __init__(self, pairs: Iterable[Tuple[str, str, str, str]], formulary=None):
+        """
+        Drug-drug interaction lookup.
+        pairs: (drug_a, drug_b, severity, description)
+        Stored as a hashed adjacency index keyed by normalized drug id, so
+        checking one drug against k other drugs is k dict lookups.
+        formulary: optional Formulary used to map brand/OCR names to canonical ids
+        """
+        self.formulary = formulary
+        self.adjacency = {}
+        self.pair_count = 0
+        self.names = {}
+
+        for drug_a, drug_b, severity, description in pairs:
+            # Same mapping as queries, so brand names and synonyms in the dataset still match
+            name_a, name_b = self.canonical_name(drug_a), self.canonical_name(drug_b)
+            id_a, id_b = self.drug_id(drug_a), self.drug_id(drug_b)
+            if not id_a or not id_b or id_a == id_b:
+                continue
+            entry = {'severity': (severity or 'unknown').strip().lower(), 'description': description or ''}
+            self.adjacency.setdefault(id_a, {})[id_b] = entry
+            self.adjacency.setdefault(id_b, {})[id_a] = entry
+            self.names.setdefault(id_a, name_a)
+            self.names.setdefault(id_b, name_b)
+            self.pair_count += 1
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INTERACTIONS_PATH, formulary=None) -> "InteractionIndex":
+        """
+        Load a CSV interaction dataset with columns: drug_a, drug_b, severity, description
+        """
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            pairs = [
+                (row['drug_a'], row['drug_b'], row.get('severity', ''), row.get('description', ''))
+                for row in csv.DictReader(f)
+            ]
+        return cls(pairs, formulary)
+
+    def canonical_name(self, name: str) -> Optional[str]:
+        """Canonical formulary name for a raw, brand or canonical drug name"""
+        if not name:
+            return None
+        if self.formulary is not None:
+            match = self.formulary.normalize(name)
+            if match:
+                return match['canonical_name']
+        return name.strip()
+
+    def drug_id(self, name: str) -> Optional[str]:
+        """Normalized drug id for a raw or canonical drug name"""
+        return normalize_name(self.canonical_name(name) or '') or None
+
+    def check(self, drugs: List[str], active_drugs: List[str] = None) -> List[Dict]:
+        """
+        Check newly prescribed drugs against each other and against the
+        patient's active medications.
+        Returns: [{'drug_a', 'drug_b', 'severity', 'description'}], most severe first
+        """
+        new_ids = [i for i in (self.drug_id(d) for d in drugs) if i]
+        active_ids = [i for i in (self.drug_id(d) for d in (active_drugs or [])) if i]
+        all_ids = list(dict.fromkeys(new_ids + active_ids))
+
+        found = {}
+        for drug in dict.fromkeys(new_ids):
+            neighbours = self.adjacency.get(drug)
+            if not neighbours:
+                continue
+            for other in all_ids:
+                entry = neighbours.get(other)
+                if entry is None:
+                    continue
+                key = frozenset((drug, other))
+                if key not in found:
+                    found[key] = {
+                        'drug_a': self.names.get(drug, drug),
+                        'drug_b': self.names.get(other, other),
+                        'severity': entry['severity'],
+                        'description': entry['description']
+                    }
+
+        return sorted(found.values(), key=lambda i: -SEVERITY_RANK.get(i['severity'], 0))
+
+    def rescreen(self, active_by_patient: Dict[int, List[str]]) -> Dict[int, List[Dict]]:
+        """
+        Bulk mode: re-check every patient's full active medication set,
+        e.g. after the interaction dataset was updated.
+        Returns only patients with at least one interaction.
+        """
+        report = {}
+        for patient_id, active_drugs in active_by_patient.items():
+            interactions = self.check(active_drugs)
+            if interactions:
+                report[patient_id] = interactions
+        return report
+
+def format_warning(interaction: Dict) -> str:
+    warning = f"⚠️ INTERACTION WARNING ({interaction['severity']}): {interaction['drug_a']} + {interaction['drug_b']}"
+    if interaction['description']:
+        warning += f" - {interaction['description']}"
+    return warning
@@ -1,17 +1,24 @@
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 from datetime import datetime
 import json
 import os
+import time
 
 from database import init_db, get_db, Patient, Prescription, Medication, IntakeLog
 from models import (
     PrescriptionAnalysisResponse, PatientCreate, PatientResponse, 
-    MedicationIntakeRequest, IntakeLogResponse, ComplianceStats, DrugEntity
+    MedicationIntakeRequest, IntakeLogResponse, ComplianceStats, DrugEntity,
+    MedicationStatusUpdate
 )
 from processor import PrescriptionProcessor
 from nlp_parser import MedicalNLPParser
+from metrics import REGISTRY, stage_timer
+from cache import TTLCache
+from reparse import reparse_prescriptions
+from batching import MicroBatcher, env_int
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -29,13 +36,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# API metrics (exposed on /metrics together with the pipeline stage timers)
+REQUEST_SECONDS = REGISTRY.histogram("medscan_http_request_duration_seconds", "API request latency")
+PRESCRIPTIONS_ANALYZED = REGISTRY.counter("medscan_prescriptions_analyzed_total", "Prescriptions analyzed by result")
+DRUGS_EXTRACTED = REGISTRY.counter("medscan_drugs_extracted_total", "Drugs extracted from analyzed prescriptions")
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Route template (e.g. /api/patients/{patient_id}) keeps label cardinality low
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        method=request.method, path=path, status=str(response.status_code)
+    )
+    return response
+
 # Initialize database
 init_db()
 
+# Read-through caches for bedside scan lookups
+# patients are keyed by ('id', patient_id) and ('code', patient_code)
+patient_cache = TTLCache(maxsize=10000, ttl=300, name="patients")
+active_meds_cache = TTLCache(maxsize=10000, ttl=60, name="active_medications")
+
 # Initialize processors
 processor = PrescriptionProcessor()
 nlp_parser = MedicalNLPParser()
 
+# Concurrent analyze requests are batched into single OCR / NER calls.
+# MEDSCAN_BATCH_MAX_SIZE=1 turns batching off.
+BATCH_MAX_SIZE = env_int("MEDSCAN_BATCH_MAX_SIZE", 8)
+BATCH_MAX_WAIT_MS = env_int("MEDSCAN_BATCH_MAX_WAIT_MS", 10)
+ocr_batcher = MicroBatcher(processor.process_prescriptions, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name="ocr")
+nlp_batcher = MicroBatcher(nlp_parser.parse_prescriptions, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name="nlp")
+
 # Create uploads directory
 os.makedirs("uploads", exist_ok=True)
 
@@ -48,6 +85,39 @@ async def root():
         "version": "1.0.0"
     }
 
+def save_prescription(db: Session, patient_id: int, image_path: str, raw_text: str, parsed_data: dict) -> Prescription:
+    """Store a parsed prescription and its medications"""
+    prescription = Prescription(
+        patient_id=patient_id,
+        image_path=image_path,
+        raw_text=raw_text,
+        structured_json=json.dumps(parsed_data),
+        timestamp=datetime.utcnow()
+    )
+    db.add(prescription)
+    db.commit()
+    db.refresh(prescription)
+    
+    # Save medications
+    for drug_data in parsed_data['drugs']:
+        medication = Medication(
+            prescription_id=prescription.id,
+            drug_name=drug_data.get('drug_name'),
+            dosage=drug_data.get('dosage'),
+            frequency=drug_data.get('frequency'),
+            duration=drug_data.get('duration'),
+            status='active'
+        )
+        db.add(medication)
+    
+    db.commit()
+    return prescription
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: per-stage and per-route latency histograms, counters"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/api/prescriptions/analyze", response_model=PrescriptionAnalysisResponse)
 async def analyze_prescription(
     file: UploadFile = File(...),
@@ -69,43 +139,26 @@ async def analyze_prescription(
         with open(image_path, "wb") as f:
             f.write(image_bytes)
         
-        # Process image with OCR
-        raw_text, ocr_details = processor.process_prescription(image_bytes)
+        # Process image with OCR (batched with concurrent requests)
+        raw_text, ocr_details = await ocr_batcher.submit(image_bytes)
         
         # Parse medical entities
-        parsed_data = nlp_parser.parse_prescription(raw_text)
+        parsed_data = await nlp_batcher.submit(raw_text)
         
-        # Check for drug interactions
+        # Check for drug interactions (new drugs + patient's active medications)
         drug_names = [drug['drug_name'] for drug in parsed_data['drugs']]
-        interaction_warnings = nlp_parser.validate_drug_interactions(drug_names)
+        active_drugs = [m['drug_name'] for m in active_medications(db, patient_id) if m['drug_name']] \
+            if patient_id is not None else []
+        interaction_warnings = nlp_parser.validate_drug_interactions(drug_names, active_drugs)
         
         all_alerts = parsed_data['alerts'] + interaction_warnings
         
         # Save to database
-        prescription = Prescription(
-            patient_id=patient_id,
-            image_path=image_path,
-            raw_text=raw_text,
-            structured_json=json.dumps(parsed_data),
-            timestamp=datetime.utcnow()
-        )
-        db.add(prescription)
-        db.commit()
-        db.refresh(prescription)
-        
-        # Save medications
-        for drug_data in parsed_data['drugs']:
-            medication = Medication(
-                prescription_id=prescription.id,
-                drug_name=drug_data.get('drug_name'),
-                dosage=drug_data.get('dosage'),
-                frequency=drug_data.get('frequency'),
-                duration=drug_data.get('duration'),
-                status='active'
-            )
-            db.add(medication)
-        
-        db.commit()
+        with stage_timer("db_commit"):
+            prescription = save_prescription(db, patient_id, image_path, raw_text, parsed_data)
+        active_meds_cache.invalidate(patient_id)
+        PRESCRIPTIONS_ANALYZED.inc(result="ok")
+        DRUGS_EXTRACTED.inc(len(parsed_data['drugs']))
         
         # Prepare response
         drug_entities = [
@@ -114,7 +167,9 @@ async def analyze_prescription(
                 dosage=drug.get('dosage'),
                 frequency=drug.get('frequency'),
                 duration=drug.get('duration'),
-                confidence=drug.get('confidence', 0.0)
+                confidence=drug.get('confidence', 0.0),
+                canonical_name=drug.get('canonical_name'),
+                match_score=drug.get('match_score', 0.0)
             )
             for drug in parsed_data['drugs']
         ]
@@ -128,8 +183,111 @@ async def analyze_prescription(
         )
         
     except Exception as e:
+        PRESCRIPTIONS_ANALYZED.inc(result="error")
         raise HTTPException(status_code=500, detail=f"Error processing prescription: {str(e)}")
 
+def patient_to_dict(patient: Patient) -> dict:
+    return {
+        "id": patient.id,
+        "name": patient.name,
+        "patient_code": patient.patient_code,
+        "last_scan_time": patient.last_scan_time
+    }
+
+def active_medications(db: Session, patient_id: int) -> list:
+    """All active medications for a patient (cached)"""
+    def load():
+        rows = (
+            db.query(Medication, Prescription.timestamp)
+            .join(Prescription, Medication.prescription_id == Prescription.id)
+            .filter(Prescription.patient_id == patient_id, Medication.status == 'active')
+            .order_by(Prescription.id, Medication.id)
+            .all()
+        )
+        return [
+            {
+                "id": medication.id,
+                "drug_name": medication.drug_name,
+                "dosage": medication.dosage,
+                "frequency": medication.frequency,
+                "duration": medication.duration,
+                "prescription_date": timestamp.isoformat()
+            }
+            for medication, timestamp in rows
+        ]
+    
+    return active_meds_cache.get_or_load(patient_id, load)
+
+@app.post("/api/admin/interactions/rescreen")
+def rescreen_interactions(reload: bool = False, db: Session = Depends(get_db)):
+    """
+    Re-check every patient's active medications against the interaction dataset.
+    Use reload=true after updating the dataset file.
+    Plain def: FastAPI runs it in a worker thread, so bedside lookups and scans
+    keep being served while every patient is re-screened.
+    """
+    if reload:
+        try:
+            nlp_parser.reload_interactions()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error loading interaction dataset: {str(e)}")
+    
+    # One query for all active medications, grouped per patient
+    rows = (
+        db.query(Prescription.patient_id, Medication.drug_name)
+        .join(Medication, Medication.prescription_id == Prescription.id)
+        .filter(Prescription.patient_id.isnot(None), Medication.status == 'active')
+        .all()
+    )
+    active_by_patient = {}
+    for patient_id, drug_name in rows:
+        if drug_name:
+            active_by_patient.setdefault(patient_id, []).append(drug_name)
+    
+    report = nlp_parser.interactions.rescreen(active_by_patient)
+    
+    return {
+        "patients_screened": len(active_by_patient),
+        "patients_flagged": len(report),
+        "interaction_pairs": nlp_parser.interactions.pair_count,
+        "results": [
+            {"patient_id": patient_id, "interactions": interactions}
+            for patient_id, interactions in report.items()
+        ]
+    }
+
+@app.post("/api/admin/prescriptions/reparse")
+def reparse_stored_prescriptions(
+    batch_size: int = 256,
+    start_after: int = 0,
+    limit: int = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Re-parse stored raw_text with the current parser (no OCR) and update
+    structured_json and medications. Committed batch by batch; pass the
+    returned last_id as start_after to continue a limited run. A failed run
+    reports the last_id of its last committed batch in the error detail.
+    Plain def: FastAPI runs it in a worker thread, so scans keep being served.
+    """
+    progress = {'last_id': start_after, 'processed': 0}
+    
+    def on_batch(state: dict):
+        progress.update(last_id=state['last_id'], processed=state['processed'])
+    
+    try:
+        return reparse_prescriptions(db, nlp_parser, batch_size=batch_size, start_after=start_after,
+                                     limit=limit, on_batch=on_batch)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail={
+            "error": f"Error re-parsing prescriptions: {str(e)}",
+            # Earlier batches are committed; continue with start_after=last_id
+            **progress
+        })
+    finally:
+        # Medications changed underneath the cache (also by committed batches of a failed run)
+        active_meds_cache.clear()
+
 @app.post("/api/patients", response_model=PatientResponse)
 async def create_patient(patient: PatientCreate, db: Session = Depends(get_db)):
     """Create a new patient record"""
@@ -141,12 +299,17 @@ async def create_patient(patient: PatientCreate, db: Session = Depends(get_db)):
     db.add(db_patient)
     db.commit()
     db.refresh(db_patient)
+    patient_cache.invalidate(('id', db_patient.id), ('code', db_patient.patient_code))
     return db_patient
 
 @app.get("/api/patients/{patient_id}", response_model=PatientResponse)
 async def get_patient(patient_id: int, db: Session = Depends(get_db)):
     """Get patient details by ID"""
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    def load():
+        patient = db.query(Patient).filter(Patient.id == patient_id).first()
+        return patient_to_dict(patient) if patient else None
+    
+    patient = patient_cache.get_or_load(('id', patient_id), load)
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
     return patient
@@ -154,7 +317,11 @@ async def get_patient(patient_id: int, db: Session = Depends(get_db)):
 @app.get("/api/patients/code/{patient_code}", response_model=PatientResponse)
 async def get_patient_by_code(patient_code: str, db: Session = Depends(get_db)):
     """Get patient details by patient code (QR/barcode scan)"""
-    patient = db.query(Patient).filter(Patient.patient_code == patient_code).first()
+    def load():
+        patient = db.query(Patient).filter(Patient.patient_code == patient_code).first()
+        return patient_to_dict(patient) if patient else None
+    
+    patient = patient_cache.get_or_load(('code', patient_code), load)
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
     return patient
@@ -186,22 +353,34 @@ async def log_medication_intake(
 @app.get("/api/medications/{patient_id}/active")
 async def get_active_medications(patient_id: int, db: Session = Depends(get_db)):
     """Get all active medications for a patient"""
-    prescriptions = db.query(Prescription).filter(Prescription.patient_id == patient_id).all()
+    return {"medications": active_medications(db, patient_id)}
+
+@app.patch("/api/medications/{medication_id}/status")
+async def update_medication_status(
+    medication_id: int,
+    update: MedicationStatusUpdate,
+    db: Session = Depends(get_db)
+):
+    """Change a medication's status (active, completed, discontinued)"""
+    if update.status not in ('active', 'completed', 'discontinued'):
+        raise HTTPException(status_code=400, detail="Status must be active, completed or discontinued")
     
-    active_meds = []
-    for prescription in prescriptions:
-        for medication in prescription.medications:
-            if medication.status == 'active':
-                active_meds.append({
-                    "id": medication.id,
-                    "drug_name": medication.drug_name,
-                    "dosage": medication.dosage,
-                    "frequency": medication.frequency,
-                    "duration": medication.duration,
-                    "prescription_date": prescription.timestamp.isoformat()
-                })
-    
-    return {"medications": active_meds}
+    medication = db.query(Medication).filter(Medication.id == medication_id).first()
+    if not medication:
+        raise HTTPException(status_code=404, detail="Medication not found")
+    
+    medication.status = update.status
+    db.commit()
+    
+    if medication.prescription:
+        active_meds_cache.invalidate(medication.prescription.patient_id)
+    
+    return {"id": medication.id, "status": medication.status}
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Hit-rate statistics for the patient and active-medication caches"""
+    return {"caches": [patient_cache.stats(), active_meds_cache.stats()]}
 
 @app.get("/api/compliance/{patient_id}", response_model=ComplianceStats)
 async def get_compliance_stats(patient_id: int, db: Session = Depends(get_db)):
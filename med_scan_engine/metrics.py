@@ -0,0 +1,156 @@
+import os
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+# Latency buckets in seconds (OpenCV steps are milliseconds, OCR/NER can take seconds)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{str(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        """Prometheus-style histogram with optional labels"""
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 3)
+            # Per-bucket counts; made cumulative when rendering
+            series[bisect_left(self.buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def summary(self) -> Dict[Tuple, Tuple[int, float]]:
+        """labels -> (count, total)"""
+        with self._lock:
+            return {key: (series[-1], series[-2]) for key, series in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_format_labels(key, le)} {cumulative}")
+                inf = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(key, inf)} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        """Prometheus-style monotonically increasing counter with optional labels"""
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class TraceRecorder:
+    def __init__(self):
+        """Collects stage timings as Chrome trace events (chrome://tracing, Perfetto)"""
+        self.events = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, name: str, start: float, duration: float):
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': round((start - self._origin) * 1e6, 1),
+            'dur': round(duration * 1e6, 1),
+            'pid': os.getpid(),
+            'tid': threading.get_ident()
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def save(self, path: str):
+        with self._lock:
+            events = list(self.events)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.tracer = None
+        self._lock = threading.Lock()
+        self.stage_seconds = self.histogram(
+            "medscan_stage_duration_seconds", "Time spent in each pipeline stage")
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self.metrics:
+                self.metrics[name] = Histogram(name, help_text, buckets)
+            return self.metrics[name]
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        with self._lock:
+            if name not in self.metrics:
+                self.metrics[name] = Counter(name, help_text)
+            return self.metrics[name]
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block as pipeline stage `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.stage_seconds.observe(duration, stage=name)
+            if self.tracer is not None:
+                self.tracer.record(name, start, duration)
+
+    def stage_breakdown(self) -> List[Dict]:
+        """Per-stage count and total time, slowest first"""
+        rows = [
+            {'stage': dict(key).get('stage', ''), 'count': count, 'total_s': total}
+            for key, (count, total) in self.stage_seconds.summary().items()
+        ]
+        return sorted(rows, key=lambda r: -r['total_s'])
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+def stage_timer(name: str):
+    """Shortcut: with stage_timer("ocr"): ..."""
+    return REGISTRY.stage(name)
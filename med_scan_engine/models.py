@@ -8,6 +8,8 @@ class DrugEntity(BaseModel):
     frequency: Optional[str] = None
     duration: Optional[str] = None
     confidence: float = 0.0
+    canonical_name: Optional[str] = None
+    match_score: float = 0.0
 
 class PrescriptionAnalysisResponse(BaseModel):
     prescription_id: int
@@ -34,6 +36,9 @@ class MedicationIntakeRequest(BaseModel):
     status: str  # taken, missed, skipped
     verification_method: str = "manual"
 
+class MedicationStatusUpdate(BaseModel):
+    status: str  # active, completed, discontinued
+
 class IntakeLogResponse(BaseModel):
     id: int
     medication_id: int
@@ -1,8 +1,11 @@
-import re
 import torch
 from typing import List, Dict
 from transformers import pipeline, AutoTokenizer, AutoModelForTokenClassification
 from models import DrugEntity
+from rule_engine import RuleEngine
+from formulary import Formulary
+from metrics import stage_timer
+from interactions import InteractionIndex, DEFAULT_INTERACTIONS, DEFAULT_INTERACTIONS_PATH, format_warning
 
 class MedicalNLPParser:
     def __init__(self):
@@ -28,40 +31,64 @@ class MedicalNLPParser:
             print("Falling back to rule-based parsing")
             self.ner_pipeline = None
         
-        # Common medical abbreviations
-        self.frequency_patterns = {
-            r'\b(once|OD|qd)\b': '1x daily',
-            r'\b(twice|BID|BD|bid)\b': '2x daily',
-            r'\b(TID|tid|thrice)\b': '3x daily',
-            r'\b(QID|qid)\b': '4x daily',
-            r'\b(PRN|prn)\b': 'as needed',
-            r'\b(QHS|qhs)\b': 'at bedtime',
-            r'\b(Q\d+H|q\d+h)\b': 'every X hours',
-        }
+        # Compiled rule engine (defaults + rules.json abbreviations)
+        self.rules = RuleEngine.from_config()
+        self.frequency_patterns = self.rules.frequency_patterns
+        self.dosage_patterns = self.rules.dosage_patterns
+        
+        # Local formulary for drug-name normalization
+        try:
+            self.formulary = Formulary.load()
+            print(f"Loaded formulary with {len(self.formulary)} drug names")
+        except Exception as e:
+            print(f"Warning: Could not load formulary: {e}")
+            self.formulary = None
         
-        self.dosage_patterns = [
-            r'(\d+\.?\d*)\s*(mg|g|ml|mcg|units?)',
-            r'(\d+)\s*(tablet|capsule|pill)s?',
-        ]
+        # Drug-drug interaction index
+        try:
+            self.interactions = InteractionIndex.load(formulary=self.formulary)
+            print(f"Loaded {self.interactions.pair_count} drug interaction pairs")
+        except Exception as e:
+            print(f"Warning: Could not load interaction dataset: {e}")
+            print("Falling back to built-in interaction list")
+            self.interactions = InteractionIndex(DEFAULT_INTERACTIONS, self.formulary)
     
     def parse_prescription(self, text: str) -> Dict:
         """
         Parse prescription text to extract drugs, dosages, and frequencies
         """
-        drugs = []
-        alerts = []
+        return self.parse_prescriptions([text])[0]
+    
+    def parse_prescriptions(self, texts: List[str], batch_size: int = 32) -> List[Dict]:
+        """
+        Parse many prescription texts at once (e.g. re-parsing stored OCR output).
+        NER runs in batches of batch_size; results are in input order.
+        """
+        ner_drugs = [[] for _ in texts]
         
         # If NER model is available, use it
-        if self.ner_pipeline:
-            drugs = self._parse_with_ner(text)
+        if self.ner_pipeline and texts:
+            with stage_timer("ner"):
+                ner_drugs = self._parse_with_ner(texts, batch_size)
+        
+        return [self._build_result(text, drugs) for text, drugs in zip(texts, ner_drugs)]
+    
+    def _build_result(self, text: str, drugs: List[Dict]) -> Dict:
+        """Rules, normalization and alerts for one text, given its NER drugs"""
+        alerts = []
         
         # Always apply rule-based parsing as fallback/enhancement
-        rule_based_drugs = self._parse_with_rules(text)
+        with stage_timer("rules"):
+            rule_based_drugs = self._parse_with_rules(text)
         
         # Merge results
         if not drugs:
             drugs = rule_based_drugs
         
+        # Map raw OCR names to canonical formulary names
+        with stage_timer("normalize"):
+            self._normalize_drugs(drugs)
+        
         # Validation and alerts
         if not drugs:
             alerts.append("⚠️ No medications detected in prescription")
@@ -77,94 +104,53 @@ class MedicalNLPParser:
             "alerts": alerts
         }
     
-    def _parse_with_ner(self, text: str) -> List[DrugEntity]:
-        """Use NER model to extract drug entities"""
+    def _parse_with_ner(self, texts: List[str], batch_size: int = 32) -> List[List[Dict]]:
+        """Use NER model to extract drug entities (one list per text)"""
         try:
-            entities = self.ner_pipeline(text)
-            drugs = []
+            # The pipeline rejects empty strings; they have no entities anyway
+            indices = [i for i, text in enumerate(texts) if text and text.strip()]
+            results = [[] for _ in texts]
+            if not indices:
+                return results
             
-            for entity in entities:
-                if entity.get('entity_group') in ['DRUG', 'MEDICATION', 'CHEMICAL']:
-                    drugs.append({
+            outputs = self.ner_pipeline([texts[i] for i in indices], batch_size=batch_size)
+            for i, entities in zip(indices, outputs):
+                results[i] = [
+                    {
                         'drug_name': entity['word'],
                         'confidence': entity['score']
-                    })
+                    }
+                    for entity in entities
+                    if entity.get('entity_group') in ['DRUG', 'MEDICATION', 'CHEMICAL']
+                ]
             
-            return drugs
+            return results
         except Exception as e:
             print(f"NER parsing failed: {e}")
-            return []
+            return [[] for _ in texts]
     
     def _parse_with_rules(self, text: str) -> List[Dict]:
         """
         Rule-based parsing for common prescription patterns
         """
-        drugs = []
-        lines = text.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if not line or len(line) < 3:
-                continue
-            
-            drug_info = {
-                'drug_name': '',
-                'dosage': '',
-                'frequency': '',
-                'duration': ''
-            }
-            
-            # Extract dosage
-            for pattern in self.dosage_patterns:
-                dosage_match = re.search(pattern, line, re.IGNORECASE)
-                if dosage_match:
-                    drug_info['dosage'] = dosage_match.group(0)
-                    break
-            
-            # Extract frequency
-            for pattern, standardized in self.frequency_patterns.items():
-                if re.search(pattern, line, re.IGNORECASE):
-                    drug_info['frequency'] = standardized
-                    break
-            
-            # Extract duration (e.g., "for 7 days", "x 14 days")
-            duration_match = re.search(r'(?:for|x)\s*(\d+)\s*(day|week|month)s?', line, re.IGNORECASE)
-            if duration_match:
-                drug_info['duration'] = f"{duration_match.group(1)} {duration_match.group(2)}s"
-            
-            # Extract drug name (everything before dosage or first 3-5 words)
-            if drug_info['dosage']:
-                drug_name_part = line.split(drug_info['dosage'])[0].strip()
-            else:
-                # Take first few words as potential drug name
-                words = line.split()[:4]
-                drug_name_part = ' '.join(words)
-            
-            drug_info['drug_name'] = drug_name_part
-            
-            # Only add if we found at least a drug name
-            if drug_info['drug_name']:
-                drugs.append(drug_info)
-        
-        return drugs
+        return self.rules.parse(text, self.formulary)
     
-    def validate_drug_interactions(self, drugs: List[str]) -> List[str]:
+    def _normalize_drugs(self, drugs: List[Dict]):
+        """Add canonical_name and match_score to each drug (in place)"""
+        for drug in drugs:
+            match = self.formulary.normalize(drug.get('drug_name', '')) if self.formulary else None
+            drug['canonical_name'] = match['canonical_name'] if match else None
+            drug['match_score'] = match['match_score'] if match else 0.0
+    
+    def validate_drug_interactions(self, drugs: List[str], active_drugs: List[str] = None) -> List[str]:
         """
-        Check for known drug interactions (simplified version)
-        In production, this would query a drug interaction database
+        Check for known drug interactions among the prescribed drugs and
+        against the patient's active medications (if given)
         """
-        warnings = []
-        
-        # Example: Simple interaction check (extend with real database)
-        dangerous_combinations = [
-            ('warfarin', 'aspirin'),
-            ('metformin', 'alcohol'),
-        ]
-        
-        drug_names_lower = [d.lower() for d in drugs]
-        
-        for drug1, drug2 in dangerous_combinations:
-            if drug1 in drug_names_lower and drug2 in drug_names_lower:
-                warnings.append(f"⚠️ INTERACTION WARNING: {drug1.title()} + {drug2.title()}")
-        
-        return warnings
+        with stage_timer("interactions"):
+            interactions = self.interactions.check(drugs, active_drugs)
+        return [format_warning(i) for i in interactions]
+    
+    def reload_interactions(self, path: str = DEFAULT_INTERACTIONS_PATH):
+        """Reload the interaction dataset (e.g. after an update)"""
+        self.interactions = InteractionIndex.load(path, formulary=self.formulary)
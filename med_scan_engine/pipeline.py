@@ -0,0 +1,184 @@
+import cProfile
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+# End-of-stream marker passed down the queues
+_DONE = object()
+
+class StagePipeline:
+    def __init__(self, stages: List[Tuple[str, Callable[[Any], Any], int]], queue_size: int = 8,
+                 profile: bool = False):
+        """
+        Streaming pipeline of (name, fn, workers) stages connected by bounded queues.
+        - Each stage runs `workers` threads; items are handed on as soon as
+          they are done, so e.g. OpenCV work (releases the GIL) overlaps with
+          model inference and disk I/O
+        - Queues hold at most queue_size items, so memory stays bounded and a
+          slow stage applies backpressure to the ones before it
+        - An exception raised by fn replaces the item and is passed through
+          the remaining stages untouched, for the consumer to report
+        Per-stage statistics (busy/starved/blocked time, input queue depth)
+        show which stage is the bottleneck.
+        cProfile only sees the thread that enabled it, so with profile=True
+        every worker records its own profile into self.profiles.
+        """
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.profile = profile
+        self.profiles = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stats = {
+            name: {
+                'workers': workers, 'items': 0, 'busy_s': 0.0, 'starved_s': 0.0,
+                'blocked_s': 0.0, 'depth_sum': 0, 'depth_samples': 0, 'depth_max': 0
+            }
+            for name, _, workers in stages
+        }
+
+    def run(self, items: Iterable) -> Iterator:
+        """
+        Feeds items through all stages and yields the results (roughly in
+        input order; stages with several workers may reorder neighbours).
+        Closing the generator early stops the pipeline.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+
+        self._start(self._feed, "pipeline-source", items, queues[0])
+        for index, (name, fn, workers) in enumerate(self.stages):
+            remaining = [max(1, workers)]
+            for n in range(max(1, workers)):
+                self._start(self._work, f"pipeline-{name}-{n}", name, fn,
+                            queues[index], queues[index + 1], remaining)
+
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _DONE or self._stop.is_set():
+                    break
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop all stages; threads finish the item they are working on"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def stats(self) -> List[Dict]:
+        """Per-stage counters in pipeline order"""
+        rows = []
+        with self._lock:
+            for name, _, _ in self.stages:
+                s = self._stats[name]
+                rows.append({
+                    'stage': name,
+                    'workers': s['workers'],
+                    'items': s['items'],
+                    'busy_s': s['busy_s'],
+                    # Share of the stage's worker time spent processing
+                    'utilization': s['busy_s'] / max(s['busy_s'] + s['starved_s'] + s['blocked_s'], 1e-9),
+                    'starved_s': s['starved_s'],
+                    'blocked_s': s['blocked_s'],
+                    'queue_mean': s['depth_sum'] / s['depth_samples'] if s['depth_samples'] else 0.0,
+                    'queue_max': s['depth_max']
+                })
+        return rows
+
+    def bottleneck(self) -> str:
+        """Stage with the most processing time per worker"""
+        rows = self.stats()
+        if not rows:
+            return None
+        return max(rows, key=lambda r: r['busy_s'] / max(r['workers'], 1))['stage']
+
+    def _start(self, target: Callable, name: str, *args):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        """Blocking put that gives up once the pipeline is stopped"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue) -> Any:
+        """Blocking get that returns _DONE once the pipeline is stopped"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _feed(self, items: Iterable, q_out: queue.Queue):
+        for item in items:
+            if not self._put(q_out, item):
+                return
+        self._put(q_out, _DONE)
+
+    def _work(self, name: str, fn: Callable, q_in: queue.Queue, q_out: queue.Queue, remaining: List[int]):
+        profiler = None
+        if self.profile:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+: the already active profiler covers every thread
+                profiler = None
+        try:
+            self._serve(name, fn, q_in, q_out, remaining)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                with self._lock:
+                    self.profiles.append(profiler)
+
+    def _serve(self, name: str, fn: Callable, q_in: queue.Queue, q_out: queue.Queue, remaining: List[int]):
+        stats = self._stats[name]
+        while True:
+            start = time.perf_counter()
+            depth = q_in.qsize()
+            item = self._get(q_in)
+            got = time.perf_counter()
+
+            if item is _DONE:
+                # Leave the marker for the other workers of this stage;
+                # the last one to finish passes it downstream
+                self._put(q_in, _DONE)
+                with self._lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    self._put(q_out, _DONE)
+                return
+
+            if isinstance(item, Exception):
+                result = item
+            else:
+                try:
+                    result = fn(item)
+                except Exception as e:
+                    result = e
+            done = time.perf_counter()
+
+            delivered = self._put(q_out, result)
+            with self._lock:
+                stats['items'] += 1
+                stats['starved_s'] += got - start
+                stats['busy_s'] += done - got
+                stats['blocked_s'] += time.perf_counter() - done
+                stats['depth_sum'] += depth
+                stats['depth_samples'] += 1
+                stats['depth_max'] = max(stats['depth_max'], depth)
+            if not delivered:
+                return
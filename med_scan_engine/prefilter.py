@@ -0,0 +1,154 @@
+import re
+import time
+import cv2
+import numpy as np
+from typing import Dict
+
+# Words that commonly appear on prescriptions
+RX_KEYWORDS = {
+    'rx', 'tab', 'tabs', 'tablet', 'tablets', 'cap', 'caps', 'capsule', 'capsules',
+    'syp', 'syrup', 'inj', 'injection', 'ointment', 'drops',
+    'dose', 'daily', 'od', 'bd', 'bid', 'tid', 'qid', 'prn', 'hs', 'qhs', 'sos',
+    'before', 'after', 'meals', 'food', 'days', 'weeks', 'dr', 'doctor', 'patient',
+    'diagnosis', 'sig', 'refill', 'refills', 'prescription', 'clinic', 'hospital',
+    'mbbs', 'md', 'age', 'sex',
+}
+
+# Words that point to receipts, invoices, screenshots, etc.
+NON_RX_KEYWORDS = {
+    'invoice', 'gst', 'cgst', 'sgst', 'vat', 'total', 'subtotal', 'qty', 'amount',
+    'cashier', 'receipt', 'bill', 'price', 'discount', 'payment', 'card', 'cash',
+    'change', 'http', 'https', 'www', 'url', 'com', 'login', 'password', 'download',
+    'email', 'click', 'scraper',
+}
+
+# Strengths with or without a unit ("500mg", "500", "2.5 ml"), but not prices,
+# dates, phone numbers or percentages ("500.00", "12/05", "98765-43210", "5%")
+DOSAGE_TOKEN = re.compile(r'(?<![\w.,:/-])\d{1,4}(?:\.\d)?\s*(?:mg|ml|mcg|g|iu|units?)?(?![\w.,:/%-])')
+# Dose schedules ("1-0-1") and short durations ("5d", "2 wks")
+SCHEDULE_TOKEN = re.compile(r'(?<![\w-])[0-2](?:-[0-2]){2}(?![\w-])')
+DURATION_TOKEN = re.compile(r'(?<![\w.])\d{1,3}\s*(?:d|days?|w|wks?|weeks?)\b')
+WORD_TOKEN = re.compile(r'[a-z]+')
+
+class PrescriptionPrefilter:
+    def __init__(self, reader=None, threshold: float = 0.3, thumbnail_size: int = 640, formulary=None):
+        """
+        Cheap pre-filter that rejects obvious non-prescription images
+        before the full preprocessing + OCR + NER pipeline.
+
+        reader: optional EasyOCR reader used for the low resolution keyword pass.
+                Without it only the layout checks are applied.
+        formulary: optional Formulary; drug names it recognizes count as
+                   prescription evidence.
+        The keyword pass only rejects when non-prescription words clearly
+        outweigh prescription evidence; text with no hits either way
+        (e.g. handwriting the low resolution pass cannot read) is accepted.
+        """
+        self.reader = reader
+        self.formulary = formulary
+        self.threshold = threshold
+        self.thumbnail_size = thumbnail_size
+
+    def evaluate(self, image_bytes: bytes) -> Dict:
+        """
+        Score an image.
+        Returns: {'accept', 'score', 'reason', 'features', 'elapsed_ms'}
+        """
+        start = time.perf_counter()
+        thumb = self._thumbnail(image_bytes)
+
+        if thumb is None:
+            return self._verdict(False, 0.0, "unreadable image", {}, start)
+
+        features = self.layout_features(thumb)
+
+        # Stage 1: layout only (milliseconds)
+        if features['ink_ratio'] < 0.002:
+            return self._verdict(False, 0.0, "blank page", features, start)
+        if features['ink_ratio'] > 0.5:
+            return self._verdict(False, 0.0, "no text-like layout (photo or dark image)", features, start)
+        if features['text_components'] < 5:
+            return self._verdict(False, 0.0, "too little text", features, start)
+
+        if self.reader is None:
+            return self._verdict(True, 1.0, "layout ok", features, start)
+
+        # Stage 2: keyword score on a low resolution OCR pass
+        fragments = self.reader.readtext(thumb, detail=0)
+        positive, negative = self.keyword_hits(" ".join(fragments))
+        features['rx_keywords'] = positive
+        features['non_rx_keywords'] = negative
+
+        # Smoothed share of prescription evidence: 0.5 without hits either way
+        score = (positive + 1) / (positive + negative + 2)
+        if negative > 0 and score < self.threshold:
+            return self._verdict(False, score, "low prescription keyword score", features, start)
+        if positive == 0 and negative == 0:
+            return self._verdict(True, score, "no keywords either way", features, start)
+        return self._verdict(True, score, "prescription keywords found", features, start)
+
+    def _thumbnail(self, image_bytes: bytes):
+        nparr = np.frombuffer(image_bytes, np.uint8)
+        # Let the decoder downsample (much faster than full decode + resize for JPEG)
+        img = cv2.imdecode(nparr, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+        if img is None:
+            return None
+
+        height, width = img.shape[:2]
+        longest = max(height, width)
+        if longest > self.thumbnail_size:
+            scale = self.thumbnail_size / longest
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return img
+
+    def layout_features(self, thumb: np.ndarray) -> Dict:
+        """
+        Text density and layout features of a grayscale thumbnail
+        """
+        _, binary = cv2.threshold(thumb, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        height = binary.shape[0]
+        ink_ratio = float(np.count_nonzero(binary)) / binary.size
+
+        # Connected components with a character-like height
+        _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        heights = stats[1:, cv2.CC_STAT_HEIGHT]
+        widths = stats[1:, cv2.CC_STAT_WIDTH]
+        text_like = (
+            (heights >= max(3, height * 0.005)) & (heights <= height * 0.08) &
+            (widths <= heights * 15)
+        )
+
+        # Count text rows from the horizontal projection profile
+        row_ink = np.count_nonzero(binary, axis=1) > binary.shape[1] * 0.01
+        text_lines = int(np.count_nonzero(row_ink[1:] & ~row_ink[:-1]) + (1 if row_ink[0] else 0))
+
+        return {
+            'ink_ratio': round(ink_ratio, 4),
+            'text_components': int(np.count_nonzero(text_like)),
+            'text_lines': text_lines,
+        }
+
+    def keyword_hits(self, text: str):
+        """
+        Count prescription evidence (keywords, strengths, schedules, durations,
+        formulary drug names) vs non-prescription vocabulary in text
+        """
+        text = text.lower()
+        words = WORD_TOKEN.findall(text)
+        positive = sum(1 for w in words if w in RX_KEYWORDS)
+        positive += len(DOSAGE_TOKEN.findall(text)) + len(SCHEDULE_TOKEN.findall(text)) + \
+            len(DURATION_TOKEN.findall(text))
+        negative = sum(1 for w in words if w in NON_RX_KEYWORDS)
+        if self.formulary is not None:
+            positive += sum(1 for w in words if len(w) >= 4 and w not in RX_KEYWORDS
+                            and w not in NON_RX_KEYWORDS and self.formulary.lookup(w))
+        return positive, negative
+
+    def _verdict(self, accept: bool, score: float, reason: str, features: Dict, start: float) -> Dict:
+        return {
+            'accept': accept,
+            'score': round(score, 3),
+            'reason': reason,
+            'features': features,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)
+        }
@@ -1,15 +1,119 @@
 import cv2
+from collections import deque
 import numpy as np
 import easyocr
-from typing import Tuple
+from typing import Tuple, List, Dict, Union
+from metrics import stage_timer
+
+# EasyOCR's default detector canvas: larger inputs are shrunk to fit
+OCR_CANVAS_SIZE = 2560
+
+def _chain_lines(y_center: np.ndarray, column_ids: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Line id per box: within each column, consecutive (sorted) vertical centers
+    closer than tolerance are chained into one line
+    """
+    by_column_y = np.lexsort((y_center, column_ids))
+    breaks = (np.diff(column_ids[by_column_y]) != 0) | (np.diff(y_center[by_column_y]) > tolerance)
+    line_ids = np.empty(len(y_center), dtype=np.int64)
+    line_ids[by_column_y] = np.concatenate(([0], np.cumsum(breaks)))
+    return line_ids
+
+def reconstruct_lines(results: list, line_tolerance: float = 0.5, column_gap: float = 3.0,
+                      min_misaligned: float = 0.5) -> List[Dict]:
+    """
+    Group EasyOCR boxes into reading-order lines (column by column,
+    top-to-bottom, left-to-right)
+    - Candidate columns are separated by vertical gutters wider than
+      column_gap * median box height
+    - A gutter only separates columns if the text on its two sides is not
+      row-aligned: at least min_misaligned of the lines on the side with fewer
+      lines have no line across it within half the line tolerance. Table cells
+      (drug | dose | frequency) share a baseline, so their rows stay one line
+    - Within a column, boxes whose vertical centers are within
+      line_tolerance * median box height are chained into the same line
+    Returns one dict per line: {'text', 'bbox', 'confidence', 'boxes', 'columns'}
+    """
+    if not results:
+        return []
+    
+    boxes = np.array([np.asarray(item[0], dtype=np.float32).reshape(4, 2) for item in results])
+    confidences = np.array([float(item[2]) for item in results], dtype=np.float32)
+    x_min = boxes[:, :, 0].min(axis=1)
+    x_max = boxes[:, :, 0].max(axis=1)
+    y_min = boxes[:, :, 1].min(axis=1)
+    y_max = boxes[:, :, 1].max(axis=1)
+    y_center = (y_min + y_max) / 2
+    median_height = max(float(np.median(y_max - y_min)), 1.0)
+    tolerance = line_tolerance * median_height
+    
+    # Candidate gutters: wide empty runs in the horizontal occupancy profile of all boxes
+    left = np.clip(np.floor(x_min), 0, None).astype(np.int64)
+    right = np.clip(np.ceil(x_max), 0, None).astype(np.int64)
+    right = np.maximum(right, left + 1)
+    profile = np.zeros(right.max() + 1, dtype=np.int64)
+    np.add.at(profile, left, 1)
+    np.add.at(profile, right, -1)
+    covered = np.concatenate(([True], np.cumsum(profile)[:-1] > 0, [True]))
+    changes = np.flatnonzero(covered[1:] != covered[:-1])
+    gap_start, gap_end = changes[0::2], changes[1::2]
+    gutters = (gap_start > left.min()) & (gap_end - gap_start >= column_gap * median_height)
+    gutter_centers = (gap_start[gutters] + gap_end[gutters]) / 2
+    x_center = (x_min + x_max) / 2
+    
+    # Keep a gutter only if the lines on its two sides do not line up
+    segment_ids = np.searchsorted(gutter_centers, x_center)
+    segment_line_ids = _chain_lines(y_center, segment_ids, tolerance)
+    line_count = segment_line_ids.max() + 1
+    line_y = np.bincount(segment_line_ids, weights=y_center, minlength=line_count) / \
+             np.bincount(segment_line_ids, minlength=line_count)
+    line_segment = np.zeros(line_count, dtype=np.int64)
+    line_segment[segment_line_ids] = segment_ids
+    separating = np.zeros(len(gutter_centers), dtype=bool)
+    for g in range(len(gutter_centers)):
+        left_y, right_y = line_y[line_segment == g], line_y[line_segment == g + 1]
+        fewer, more = (left_y, right_y) if len(left_y) <= len(right_y) else (right_y, left_y)
+        nearest = np.abs(fewer[:, None] - more[None, :]).min(axis=1)
+        separating[g] = np.mean(nearest > tolerance / 2) >= min_misaligned
+    column_ids = np.searchsorted(gutter_centers[separating], x_center)
+    
+    # Lines: within each column, so a line never spans two real columns
+    line_ids = _chain_lines(y_center, column_ids, tolerance)
+    
+    # Reading order: column by column, top to bottom, then left to right
+    order = np.lexsort((x_min, line_ids))
+    splits = np.flatnonzero(np.diff(line_ids[order])) + 1
+    
+    lines = []
+    for members in np.split(order, splits):
+        lines.append({
+            'text': " ".join(results[i][1] for i in members),
+            'bbox': [int(x_min[members].min()), int(y_min[members].min()),
+                     int(x_max[members].max()), int(y_max[members].max())],
+            'confidence': round(float(confidences[members].mean()), 4),
+            'boxes': [int(i) for i in members],
+            'columns': sorted({int(c) for c in column_ids[members]}),
+        })
+    
+    return lines
 
 class PrescriptionProcessor:
-    def __init__(self):
+    def __init__(self, cascade: bool = False, cascade_scale: float = 0.5, cascade_threshold: float = 0.5,
+                 max_pad_ratio: float = 1.25):
         # Initialize EasyOCR reader (supports handwritten text)
         # Enable GPU if available, EasyOCR handles the fallback gracefully usually, 
         # but explicit True often forces checking.
         print("Initializing EasyOCR with GPU...")
         self.reader = easyocr.Reader(['en'], gpu=True)
+        
+        # Cascade OCR settings: detect/recognize on a downscaled copy first and
+        # only re-recognize low-confidence regions at full resolution
+        self.cascade = cascade
+        self.cascade_scale = cascade_scale
+        self.cascade_threshold = cascade_threshold
+        
+        # Batched OCR: max padded area / own area for images sharing a batch
+        self.max_pad_ratio = max_pad_ratio
     
     def preprocess_image(self, image_bytes: bytes) -> np.ndarray:
         """
@@ -20,45 +124,194 @@ class PrescriptionProcessor:
         - Deskew if needed
         """
         # Convert bytes to numpy array
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        with stage_timer("decode"):
+            nparr = np.frombuffer(image_bytes, np.uint8)
+            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            if img is None:
+                raise ValueError("Could not decode image")
+            
+            # Convert to grayscale
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         
         # Denoise
-        denoised = cv2.fastNlMeansDenoising(gray, h=10)
+        with stage_timer("denoise"):
+            denoised = cv2.fastNlMeansDenoising(gray, h=10)
         
         # Enhance contrast using CLAHE
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(denoised)
+        with stage_timer("clahe"):
+            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+            enhanced = clahe.apply(denoised)
         
         # Adaptive thresholding for better text extraction
-        thresh = cv2.adaptiveThreshold(
-            enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-            cv2.THRESH_BINARY, 11, 2
-        )
+        with stage_timer("threshold"):
+            thresh = cv2.adaptiveThreshold(
+                enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+                cv2.THRESH_BINARY, 11, 2
+            )
         
         return thresh
     
-    def extract_text(self, processed_image: np.ndarray) -> Tuple[str, list]:
+    def extract_text(self, processed_image: np.ndarray, cascade: bool = None) -> Tuple[str, list]:
         """
         Extract text from preprocessed image using EasyOCR
         Returns: (full_text, detailed_results)
+        full_text has one line per reconstructed text line
+        """
+        full_text, results, _ = self.extract_layout(processed_image, cascade)
+        return full_text, results
+    
+    def extract_layout(self, processed_image: np.ndarray, cascade: bool = None) -> Tuple[str, list, List[Dict]]:
+        """
+        Same as extract_text, plus per-line box metadata from reconstruct_lines
+        Returns: (full_text, detailed_results, lines)
         """
+        if cascade is None:
+            cascade = self.cascade
+        
         # EasyOCR expects RGB image
+        rgb_image = self._to_rgb(processed_image)
+        
+        # Perform OCR
+        with stage_timer("ocr"):
+            if cascade:
+                results = self._cascade_readtext(rgb_image)
+            else:
+                results = self.reader.readtext(rgb_image)
+        
+        return self._layout(results)
+    
+    def _to_rgb(self, processed_image: np.ndarray) -> np.ndarray:
         if len(processed_image.shape) == 2:
-            rgb_image = cv2.cvtColor(processed_image, cv2.COLOR_GRAY2RGB)
+            return cv2.cvtColor(processed_image, cv2.COLOR_GRAY2RGB)
+        return processed_image
+    
+    def _layout(self, results: list) -> Tuple[str, list, List[Dict]]:
+        # Rebuild reading-order lines from the boxes
+        with stage_timer("layout"):
+            lines = reconstruct_lines(results)
+        full_text = "\n".join(line['text'] for line in lines)
+        
+        return full_text, results, lines
+    
+    def extract_texts(self, processed_images: List[np.ndarray]) -> List[Tuple[str, list]]:
+        """
+        extract_text for several images, batching similar-sized ones into one
+        EasyOCR call. Images in a batch are padded (white, bottom/right) to a
+        common size, so box coordinates are unchanged.
+        Only images whose padded size stays within the detector canvas and
+        within max_pad_ratio of their own area share a batch, so the result
+        for one image never depends on what it was batched with. Everything
+        else (and cascade mode) goes through extract_text one at a time.
+        """
+        outputs = [None] * len(processed_images)
+        if self.cascade or not hasattr(self.reader, 'readtext_batched'):
+            groups = [[i] for i in range(len(processed_images))]
         else:
-            rgb_image = processed_image
+            groups = self._size_groups(processed_images)
         
-        # Perform OCR
-        results = self.reader.readtext(rgb_image)
+        for group in groups:
+            if len(group) == 1:
+                outputs[group[0]] = self.extract_text(processed_images[group[0]])
+                continue
+            
+            images = [processed_images[i] for i in group]
+            height = max(img.shape[0] for img in images)
+            width = max(img.shape[1] for img in images)
+            padded = [
+                self._to_rgb(cv2.copyMakeBorder(img, 0, height - img.shape[0], 0, width - img.shape[1],
+                                                cv2.BORDER_CONSTANT, value=255))
+                for img in images
+            ]
+            
+            with stage_timer("ocr"):
+                batch_results = self.reader.readtext_batched(padded, batch_size=len(padded))
+            
+            for i, results in zip(group, batch_results):
+                full_text, results, _ = self._layout(results)
+                outputs[i] = (full_text, results)
         
-        # Extract text and confidence scores
-        full_text = " ".join([item[1] for item in results])
+        return outputs
+    
+    def _size_groups(self, images: List[np.ndarray]) -> List[List[int]]:
+        """
+        Bucket image indices so each bucket's padded size (max height x max width)
+        - is at most OCR_CANVAS_SIZE on both sides (the detector would shrink it)
+        - is at most max_pad_ratio times the area of every image in it
+        """
+        groups = []  # [indices, height, width, smallest area]
+        for i in sorted(range(len(images)), key=lambda i: images[i].shape[0] * images[i].shape[1]):
+            h, w = images[i].shape[:2]
+            area = h * w
+            for group in groups:
+                height, width = max(group[1], h), max(group[2], w)
+                if (height <= OCR_CANVAS_SIZE and width <= OCR_CANVAS_SIZE
+                        and height * width <= self.max_pad_ratio * min(group[3], area)):
+                    group[0].append(i)
+                    group[1], group[2], group[3] = height, width, min(group[3], area)
+                    break
+            else:
+                groups.append([[i], h, w, area])
+        return [group[0] for group in groups]
+    
+    def _cascade_readtext(self, rgb_image: np.ndarray) -> List:
+        """
+        Two-pass OCR:
+        - Detect and recognize on a downscaled copy (cheap)
+        - Re-recognize only the low-confidence boxes on the full resolution image
+        Returns results in the same (box, text, confidence) format as readtext
+        """
+        height, width = rgb_image.shape[:2]
+        scale = self.cascade_scale
+        if scale >= 1.0 or min(height, width) * scale < 32:
+            # Image too small to benefit from a low resolution pass
+            return self.reader.readtext(rgb_image)
         
-        return full_text, results
+        small = cv2.resize(rgb_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        coarse_results = self.reader.readtext(small)
+        
+        results = []
+        low_conf_indices = []
+        low_conf_regions = []
+        for box, text, conf in coarse_results:
+            # Map box back to full resolution coordinates
+            full_box = [[int(round(x / scale)), int(round(y / scale))] for x, y in box]
+            results.append((full_box, text, conf))
+            
+            if conf < self.cascade_threshold:
+                xs = [p[0] for p in full_box]
+                ys = [p[1] for p in full_box]
+                # Small margin so clipped strokes are not lost at the crop edges
+                pad = max(2, int((max(ys) - min(ys)) * 0.1))
+                x_min = max(0, min(xs) - pad)
+                x_max = min(width, max(xs) + pad)
+                y_min = max(0, min(ys) - pad)
+                y_max = min(height, max(ys) + pad)
+                if x_max > x_min and y_max > y_min:
+                    low_conf_indices.append(len(results) - 1)
+                    low_conf_regions.append([x_min, x_max, y_min, y_max])
+        
+        if not low_conf_regions:
+            return results
+        
+        # Recognition only (no detection) on the full resolution crops, in one batch
+        gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY)
+        refined = self.reader.recognize(gray, horizontal_list=low_conf_regions, free_list=[],
+                                        batch_size=len(low_conf_regions))
+        # EasyOCR returns the crops sorted top to bottom (and drops unreadable ones),
+        # so each result is mapped back through its box, which is the clipped region
+        region_indices = {}
+        for index, (x_min, x_max, y_min, y_max) in zip(low_conf_indices, low_conf_regions):
+            region_indices.setdefault((x_min, y_min, x_max, y_max), deque()).append(index)
+        for box, text, conf in refined:
+            (x_min, y_min), (x_max, y_max) = box[0], box[2]
+            indices = region_indices.get((int(x_min), int(y_min), int(x_max), int(y_max)))
+            if not indices:
+                continue
+            index = indices.popleft()
+            if conf > results[index][2]:
+                results[index] = (results[index][0], text, conf)
+        
+        return results
     
     def process_prescription(self, image_bytes: bytes) -> Tuple[str, list]:
         """
@@ -67,3 +320,22 @@ class PrescriptionProcessor:
         processed_img = self.preprocess_image(image_bytes)
         text, details = self.extract_text(processed_img)
         return text, details
+    
+    def process_prescriptions(self, images: List[bytes]) -> List[Union[Tuple[str, list], Exception]]:
+        """
+        Batched process_prescription: preprocess each image, then OCR the valid ones together.
+        An image that fails to decode or preprocess gets its exception in place
+        of a result, so it does not fail (or re-run) the rest of the batch.
+        """
+        outputs = [None] * len(images)
+        processed, valid = [], []
+        for i, image_bytes in enumerate(images):
+            try:
+                processed.append(self.preprocess_image(image_bytes))
+                valid.append(i)
+            except Exception as e:
+                outputs[i] = e
+        
+        for i, output in zip(valid, self.extract_texts(processed)):
+            outputs[i] = output
+        return outputs
@@ -0,0 +1,151 @@
+import os
+import json
+from typing import List, Dict, Callable
+from sqlalchemy.orm import Session, selectinload
+from database import Prescription, Medication
+from metrics import stage_timer
+from formulary import normalize_name
+
+DEFAULT_CHECKPOINT_PATH = "reparse_checkpoint.json"
+
+def load_checkpoint(path: str = DEFAULT_CHECKPOINT_PATH) -> Dict:
+    """Progress of an interrupted reparse run ({} if there is none)"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_checkpoint(state: Dict, path: str = DEFAULT_CHECKPOINT_PATH):
+    # Write-then-rename so a crash never leaves a half-written checkpoint
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_path, path)
+
+def drug_key(drug_name: str, canonical_name: str = None, formulary=None) -> str:
+    """
+    Identity of a drug for matching stored rows to parsed drugs:
+    its canonical formulary name, else its normalized name
+    """
+    if not canonical_name and formulary is not None and drug_name:
+        match = formulary.normalize(drug_name)
+        canonical_name = match['canonical_name'] if match else None
+    return normalize_name(canonical_name or drug_name or '')
+
+def sync_medications(db: Session, prescription: Prescription, drugs: List[Dict], formulary=None) -> Dict:
+    """
+    Make a prescription's Medication rows match freshly parsed drugs.
+    Rows and drugs are matched by drug_key, never by position, so a row
+    (and its intake logs) always stays with the same drug.
+    - Matched rows are updated in place (ids, status and intake logs are kept)
+    - Drugs without a row get new active rows
+    - Rows that match no drug are discontinued if they have intake logs, deleted otherwise
+    """
+    counts = {'updated': 0, 'added': 0, 'discontinued': 0, 'deleted': 0}
+
+    unmatched = {}
+    for medication in sorted(prescription.medications, key=lambda m: m.id):
+        unmatched.setdefault(drug_key(medication.drug_name, formulary=formulary), []).append(medication)
+
+    for drug in drugs:
+        rows = unmatched.get(drug_key(drug.get('drug_name'), drug.get('canonical_name'), formulary))
+        if rows:
+            medication = rows.pop(0)
+            medication.drug_name = drug.get('drug_name')
+            medication.dosage = drug.get('dosage')
+            medication.frequency = drug.get('frequency')
+            medication.duration = drug.get('duration')
+            counts['updated'] += 1
+            continue
+
+        db.add(Medication(
+            prescription_id=prescription.id,
+            drug_name=drug.get('drug_name'),
+            dosage=drug.get('dosage'),
+            frequency=drug.get('frequency'),
+            duration=drug.get('duration'),
+            status='active'
+        ))
+        counts['added'] += 1
+
+    for rows in unmatched.values():
+        for medication in rows:
+            if medication.intake_logs:
+                medication.status = 'discontinued'
+                counts['discontinued'] += 1
+            else:
+                db.delete(medication)
+                counts['deleted'] += 1
+
+    return counts
+
+def reparse_prescriptions(db: Session, nlp_parser, batch_size: int = 256, start_after: int = 0,
+                          limit: int = None, checkpoint_path: str = None,
+                          on_batch: Callable[[Dict], None] = None) -> Dict:
+    """
+    Re-run the NLP parser over the stored raw_text of every prescription
+    (no OCR) and update structured_json and the Medication rows.
+    - Prescriptions are processed in id order, batch_size at a time
+    - Each batch is committed in its own transaction, then checkpointed
+    - start_after / the checkpoint's last_id resume an interrupted run
+    Returns run statistics, including last_id, done (nothing left to parse)
+    and the affected patient_ids.
+    """
+    state = {
+        'last_id': start_after,
+        'processed': 0,
+        'changed': 0,
+        'unchanged': 0,
+        'medications': {'updated': 0, 'added': 0, 'discontinued': 0, 'deleted': 0}
+    }
+    patient_ids = set()
+    done = False
+
+    while limit is None or state['processed'] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - state['processed'])
+        # Keyset pagination: cheap at any offset and stable if rows are added meanwhile
+        with stage_timer("reparse_load"):
+            batch = (
+                db.query(Prescription)
+                .options(selectinload(Prescription.medications).selectinload(Medication.intake_logs))
+                .filter(Prescription.id > state['last_id'], Prescription.raw_text.isnot(None))
+                .order_by(Prescription.id)
+                .limit(size)
+                .all()
+            )
+        if not batch:
+            done = True
+            break
+        # Read before commit: committed rows are expired and then detached below
+        last_id = batch[-1].id
+
+        parsed = nlp_parser.parse_prescriptions([p.raw_text for p in batch])
+
+        try:
+            with stage_timer("reparse_commit"):
+                for prescription, parsed_data in zip(batch, parsed):
+                    structured_json = json.dumps(parsed_data)
+                    if structured_json == prescription.structured_json:
+                        state['unchanged'] += 1
+                        continue
+                    prescription.structured_json = structured_json
+                    for key, count in sync_medications(db, prescription, parsed_data['drugs'], nlp_parser.formulary).items():
+                        state['medications'][key] += count
+                    state['changed'] += 1
+                    if prescription.patient_id is not None:
+                        patient_ids.add(prescription.patient_id)
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        # Keep the session small across a long run
+        db.expunge_all()
+
+        state['processed'] += len(batch)
+        state['last_id'] = last_id
+        if checkpoint_path:
+            save_checkpoint(state, checkpoint_path)
+        if on_batch:
+            on_batch(state)
+
+    return {**state, 'done': done, 'patient_ids': sorted(patient_ids)}
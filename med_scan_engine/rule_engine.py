@@ -0,0 +1,181 @@
+import re
+import json
+import os
+import itertools
+from typing import List, Dict
+
+# Common medical abbreviations
+DEFAULT_FREQUENCY_PATTERNS = {
+    r'\b(once|OD|qd)\b': '1x daily',
+    r'\b(twice|BID|BD|bid)\b': '2x daily',
+    r'\b(TID|tid|thrice)\b': '3x daily',
+    r'\b(QID|qid)\b': '4x daily',
+    r'\b(PRN|prn)\b': 'as needed',
+    r'\b(QHS|qhs)\b': 'at bedtime',
+    r'\b(Q\d+H|q\d+h)\b': 'every X hours',
+}
+
+DEFAULT_DOSAGE_PATTERNS = [
+    r'(\d+\.?\d*)\s*(mg|g|ml|mcg|units?)',
+    r'(\d+)\s*(tablet|capsule|pill)s?',
+]
+
+# e.g. "for 7 days", "x 14 days"
+DURATION_PATTERN = r'(?:for|x)\s*(?P<duration_n>\d+)\s*(?P<duration_u>day|week|month)s?'
+
+# Frequency patterns that are just a list of words, e.g. \b(BID|BD|bid)\b
+WORD_ALTERNATION = re.compile(r'\\b\(((?:[\w]|\\-)+(?:\|(?:[\w]|\\-)+)*)\)\\b')
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json")
+
+class RuleEngine:
+    def __init__(self, frequency_patterns: Dict[str, str] = None, dosage_patterns: List[str] = None):
+        """
+        Rule-based prescription line parser.
+        All patterns are compiled into one alternation of named groups so
+        dosage, frequency and duration are found in a single scan per line.
+        """
+        self.frequency_patterns = dict(frequency_patterns or DEFAULT_FREQUENCY_PATTERNS)
+        self.dosage_patterns = list(dosage_patterns or DEFAULT_DOSAGE_PATTERNS)
+        self._compile()
+
+    @classmethod
+    def from_config(cls, path: str = DEFAULT_RULES_PATH) -> "RuleEngine":
+        """
+        Build an engine from the defaults extended with a JSON rules file:
+        {
+            "frequency_abbreviations": {"TDS": "3x daily"},   # literal words
+            "frequency_patterns": {"\\\\bevery morning\\\\b": "1x daily"},  # regexes
+            "dosage_patterns": ["(\\\\d+)\\\\s*(drops?)"]
+        }
+        """
+        frequency_patterns = dict(DEFAULT_FREQUENCY_PATTERNS)
+        dosage_patterns = list(DEFAULT_DOSAGE_PATTERNS)
+
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    config = json.load(f)
+                for abbreviation, standardized in config.get('frequency_abbreviations', {}).items():
+                    frequency_patterns[rf'\b({re.escape(abbreviation)})\b'] = standardized
+                frequency_patterns.update(config.get('frequency_patterns', {}))
+                dosage_patterns.extend(config.get('dosage_patterns', []))
+            except Exception as e:
+                print(f"Warning: Could not load rules from {path}: {e}")
+
+        return cls(frequency_patterns, dosage_patterns)
+
+    def _compile(self):
+        """
+        Build the combined scanner.
+        - Plain word alternations like \\b(TID|tid|thrice)\\b are folded into one
+          group and resolved with a dict lookup
+        - Other patterns become their own named group
+        - The built-in dosage and frequency patterns can only start at a digit
+          or word boundary; runs of them share a (?=\d|\b) guard, which lets
+          the regex engine skip most positions inside words without changing
+          what they match. The duration pattern ("x 7 days" also matches in
+          "Amox 7 days") and rules.json regexes are not guarded
+        """
+        # (alternative, guarded)
+        alternatives = [(f'(?P<duration>{DURATION_PATTERN})', False)]
+        self._dosage_groups = []
+        for i, pattern in enumerate(self.dosage_patterns):
+            self._dosage_groups.append(f'dosage_{i}')
+            alternatives.append((f'(?P<dosage_{i}>{pattern})', pattern in DEFAULT_DOSAGE_PATTERNS))
+
+        # word (lowercase) -> (priority, standardized)
+        self._frequency_words = {}
+        # group name -> (priority, standardized)
+        self._frequency_groups = {}
+        for i, (pattern, standardized) in enumerate(self.frequency_patterns.items()):
+            words = WORD_ALTERNATION.fullmatch(pattern)
+            if words:
+                for word in words.group(1).split('|'):
+                    self._frequency_words.setdefault(word.replace('\\', '').lower(), (i, standardized))
+            else:
+                self._frequency_groups[f'frequency_{i}'] = (i, standardized)
+                alternatives.append((f'(?P<frequency_{i}>{pattern})', pattern in DEFAULT_FREQUENCY_PATTERNS))
+
+        if self._frequency_words:
+            words = sorted(self._frequency_words, key=len, reverse=True)
+            alternatives.append((r'(?P<frequency_word>\b(?:' + '|'.join(re.escape(w) for w in words) + r')\b)', True))
+
+        # Same order as before, so earlier patterns still win at the same position
+        parts = []
+        for guarded, run in itertools.groupby(alternatives, key=lambda alternative: alternative[1]):
+            run = '|'.join(alternative for alternative, _ in run)
+            parts.append(r'(?=\d|\b)(?:' + run + ')' if guarded else run)
+        self._scanner = re.compile('|'.join(parts), re.IGNORECASE)
+
+    def parse_line(self, line: str) -> Dict:
+        """
+        Extract dosage, frequency and duration from one line in a single pass.
+        Earlier patterns win over later ones, as in the pattern lists.
+        """
+        first = {}
+        frequency = None
+        for match in self._scanner.finditer(line):
+            group = match.lastgroup
+            if group == 'frequency_word':
+                candidate = self._frequency_words[match.group(group).lower()]
+            elif group in self._frequency_groups:
+                candidate = self._frequency_groups[group]
+            else:
+                first.setdefault(group, match)
+                continue
+            if frequency is None or candidate[0] < frequency[0]:
+                frequency = candidate
+
+        drug_info = {
+            'drug_name': '',
+            'dosage': '',
+            'frequency': '',
+            'duration': ''
+        }
+
+        dosage_match = next((first[g] for g in self._dosage_groups if g in first), None)
+        if dosage_match:
+            drug_info['dosage'] = dosage_match.group(0)
+
+        if frequency:
+            drug_info['frequency'] = frequency[1]
+
+        duration_match = first.get('duration')
+        if duration_match:
+            drug_info['duration'] = f"{duration_match.group('duration_n')} {duration_match.group('duration_u')}s"
+
+        # Extract drug name (everything before dosage or first 3-5 words)
+        if dosage_match:
+            drug_info['drug_name'] = line[:dosage_match.start()].strip()
+        else:
+            # Take first few words as potential drug name
+            drug_info['drug_name'] = ' '.join(line.split()[:4])
+
+        return drug_info
+
+    def parse(self, text: str, formulary=None) -> List[Dict]:
+        """
+        Rule-based parsing for common prescription patterns
+        formulary: optional Formulary; lines naming a known drug are kept even
+                   without a dosage or frequency
+        """
+        drugs = []
+        lines = text.split('\n')
+
+        for line in lines:
+            line = line.strip()
+            if not line or len(line) < 3:
+                continue
+
+            drug_info = self.parse_line(line)
+
+            # Only add if we found at least a drug name. On multi-line text, headers
+            # and footers (no dosage, frequency or known drug) are not medications.
+            if not drug_info['drug_name']:
+                continue
+            if drug_info['dosage'] or drug_info['frequency'] or len(lines) == 1 or \
+                    (formulary is not None and formulary.scan(line)):
+                drugs.append(drug_info)
+
+        return drugs
@@ -0,0 +1,34 @@
+from processor import reconstruct_lines
+
+HEIGHT = 20
+
+def box(x_min, y_min, x_max, text, conf=0.9):
+    return ([[x_min, y_min], [x_max, y_min], [x_max, y_min + HEIGHT], [x_min, y_min + HEIGHT]], text, conf)
+
+def medication_table(header_width):
+    """Header over a drug | dose | frequency | duration table, cells ~3 text heights apart"""
+    results = [box(10, 10, 10 + header_width, "Dr. A. Sharma MBBS")]
+    rows = [("Tab Amoxicillin", "500mg", "TID", "5 days"), ("Tab Paracetamol", "650mg", "SOS", "3 days")]
+    for i, (name, dose, frequency, duration) in enumerate(rows):
+        y = 60 + i * 40
+        results += [box(10, y, 170, name), box(230, y, 290, dose),
+                    box(350, y, 390, frequency), box(450, y, 520, duration)]
+    return results
+
+def texts(results):
+    return [line['text'] for line in reconstruct_lines(results)]
+
+def test_table_rows_stay_one_line():
+    expected = ["Dr. A. Sharma MBBS", "Tab Amoxicillin 500mg TID 5 days", "Tab Paracetamol 650mg SOS 3 days"]
+    # Narrow header: every table gutter is empty from top to bottom
+    assert texts(medication_table(header_width=150)) == expected
+    # Wide header: only the duration gutter is empty
+    assert texts(medication_table(header_width=400)) == expected
+
+def test_misaligned_blocks_are_separate_columns():
+    left = [box(10, 10 + i * 25, 200, f"left {i}") for i in range(4)]
+    right = [box(400, 20 + i * 37, 600, f"right {i}") for i in range(3)]
+    assert texts(left + right) == [f"left {i}" for i in range(4)] + [f"right {i}" for i in range(3)]
+
+def test_empty():
+    assert reconstruct_lines([]) == []